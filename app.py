@@ -1,11 +1,24 @@
 import streamlit as st
 import json
+import os
+from collections import deque
 from graphviz import Digraph
 import warnings
 
+from combined_lineage_db_tableau import get_column_db_lineage
+
 # Ensure page config is the first Streamlit command
 st.set_page_config(layout="wide")
 
+# Lineage file the app reads
+LINEAGE_FILE = 'combined_lineage.json'
+
+# Rendering limits: fields per page, DB lineage levels per column, and graph nodes per
+# field (raised by DEFAULT_NODE_BUDGET each time "Show more" is clicked)
+FIELDS_PER_PAGE = 10
+DEFAULT_DB_LINEAGE_DEPTH = 10
+DEFAULT_NODE_BUDGET = 50
+
 # Suppress deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
@@ -55,7 +68,15 @@ class Node:
         }
 
 # Function to build the lineage tree from the JSON data
-def build_lineage_tree(field_data):
+def build_lineage_tree(field_data, db_lineage_table=None, resolved=None, db_depth=None):
+    """
+    db_lineage_table holds the shared DB lineage nodes when combined_lineage.json
+    was written in reference mode; resolved caches the references looked up so far.
+    db_depth limits how many DB lineage levels are followed from each column.
+    """
+    db_lineage_table = db_lineage_table or {}
+    resolved = {} if resolved is None else resolved
+
     root_node = Node(
         name=field_data['name'],
         node_type='Field',
@@ -75,20 +96,23 @@ def build_lineage_tree(field_data):
         )
         root_node.add_child(column_node)
 
-        db_lineage = upstream_column.get('database_lineage', None)
+        db_lineage = get_column_db_lineage(upstream_column, db_lineage_table, resolved)
         if db_lineage:
-            lineage_node = build_db_lineage(db_lineage, set())
+            lineage_node = build_db_lineage(db_lineage, set(), db_depth)
             if lineage_node:
                 column_node.add_child(lineage_node)
 
     for upstream_field in field_data.get('upstreamFields', []):
-        upstream_field_node = build_lineage_tree(upstream_field)
+        upstream_field_node = build_lineage_tree(upstream_field, db_lineage_table, resolved, db_depth)
         root_node.add_child(upstream_field_node)
 
     return root_node
 
 # Function to build lineage nodes recursively from dblineage part
-def build_db_lineage(db_lineage, visited):
+def build_db_lineage(db_lineage, visited, depth=None):
+    """depth is the number of levels still to build, this one included; None means no limit."""
+    if depth is not None and depth <= 0:
+        return None
     node_id = f"{db_lineage['model']}.{db_lineage['column']}"
     if node_id in visited:
         return None
@@ -104,14 +128,43 @@ def build_db_lineage(db_lineage, visited):
     )
 
     for upstream_model in db_lineage.get('upstream_models', []):
-        upstream_node = build_db_lineage(upstream_model, visited)
+        upstream_node = build_db_lineage(upstream_model, visited, None if depth is None else depth - 1)
         if upstream_node:
             node.add_child(upstream_node)
 
     return node
 
+# Function to pick the first max_nodes nodes breadth first, so the nearest lineage is kept
+def limit_tree_nodes(node, max_nodes):
+    """
+    Returns (ids of the Node objects to draw, number of graph nodes left out).
+    Both the budget and the hidden count are in distinct graph node ids, since
+    Graphviz draws Node objects sharing an id as one node.
+    """
+    kept = set()
+    drawn_ids = set()
+    hidden_ids = set()
+    queue = deque([node])
+    while queue:
+        current_node = queue.popleft()
+        node_id = graph_node_id(current_node)
+        if max_nodes is None or node_id in drawn_ids or len(drawn_ids) < max_nodes:
+            kept.add(id(current_node))
+            drawn_ids.add(node_id)
+        else:
+            hidden_ids.add(node_id)
+        queue.extend(current_node.children)
+    return kept, len(hidden_ids - drawn_ids)
+
+# Function to key a node in the Graphviz graph; nodes with the same key are drawn once
+def graph_node_id(node):
+    return f"{node.name}_{node.table_name}_{node.lineage_type}"
+
 # Function to create the lineage graph using Graphviz
-def create_graph(node, theme):
+def create_graph(node, theme, max_nodes=None):
+    """Draws at most max_nodes nodes; returns (dot, number of nodes left out)."""
+    kept, hidden = limit_tree_nodes(node, max_nodes)
+
     dot = Digraph(comment='Data Lineage')
     dot.attr('graph', bgcolor=theme.bgcolor, rankdir='LR')  # Set layout to left-to-right
     dot.attr('node', style=theme.style, shape=theme.shape, fillcolor=theme.fillcolor,
@@ -130,16 +183,18 @@ def create_graph(node, theme):
         metadata = current_node.get_metadata()
         hover_text = "\n".join(f"{key}: {value}" for key, value in metadata.items())
 
-        node_id = f"{current_node.name}_{current_node.table_name}_{current_node.lineage_type}"
+        node_id = graph_node_id(current_node)
         dot.node(node_id, label=label, tooltip=hover_text)
 
         for child in current_node.children:
-            child_id = f"{child.name}_{child.table_name}_{child.lineage_type}"
+            if id(child) not in kept:
+                continue
+            child_id = graph_node_id(child)
             dot.edge(node_id, child_id)
             add_nodes_edges(child)
 
     add_nodes_edges(node)
-    return dot
+    return dot, hidden
 
 # Theme class to define visual styles
 class Theme:
@@ -160,44 +215,119 @@ def getThemes():
         "Dark": Theme("#ffffff", "#333333", "#000000", "#ffffff", "filled", "box", "#ffffff", "1"),
     }
 
+# Function to load the lineage file once per version; mtime is only part of the cache key
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_lineage_data(path, mtime):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+# Function to index the lineage by name at each level, once per lineage file version
+@st.cache_resource(max_entries=1, show_spinner=False)
+def get_lineage_index(path, mtime):
+    """
+    Returns {workbook: (workbook_data, {dashboard: (dashboard_data, {datasource:
+    (datasource_data, {sheet: (sheet_data, {field: field_data})})})})}. Dicts keep
+    the file's order, and the first object wins on duplicate names, as next() did.
+    """
+    def by_name(items):
+        index = {}
+        for item in items:
+            index.setdefault(item['name'], item)
+        return index
+
+    index = {}
+    for wb_name, wb in by_name(load_lineage_data(path, mtime).get('workbooks', [])).items():
+        dashboards = {}
+        for db_name, db in by_name(wb.get('dashboards', [])).items():
+            datasources = {}
+            for ds_name, ds in by_name(db.get('upstreamDatasources', [])).items():
+                sheets = {sheet_name: (sheet, by_name(sheet.get('upstreamFields', [])))
+                          for sheet_name, sheet in by_name(ds.get('sheets', [])).items()}
+                datasources[ds_name] = (ds, sheets)
+            dashboards[db_name] = (db, datasources)
+        index[wb_name] = (wb, dashboards)
+    return index
+
+# Function to find a field on a sheet by the names chosen in the sidebar
+def find_field(lineage_index, workbook, dashboard, datasource, sheet, field):
+    dashboards = lineage_index[workbook][1]
+    datasources = dashboards[dashboard][1]
+    sheets = datasources[datasource][1]
+    return sheets[sheet][1][field]
+
+# Function to build a field's lineage tree once per lineage file version and DB lineage depth
+@st.cache_resource(max_entries=1000, show_spinner=False)
+def get_lineage_tree(path, mtime, workbook, dashboard, datasource, sheet, field, db_depth):
+    lineage_data = load_lineage_data(path, mtime)
+    field_data = find_field(get_lineage_index(path, mtime), workbook, dashboard, datasource, sheet, field)
+    return build_lineage_tree(field_data, lineage_data.get('database_lineage', {}), db_depth=db_depth)
+
+# Function to render a field's lineage tree to DOT source once per theme and node budget
+@st.cache_data(max_entries=1000, show_spinner=False)
+def get_lineage_dot(path, mtime, workbook, dashboard, datasource, sheet, field, db_depth, theme_name, max_nodes):
+    """Returns (DOT source, number of nodes left out by max_nodes)."""
+    node = get_lineage_tree(path, mtime, workbook, dashboard, datasource, sheet, field, db_depth)
+    dot, hidden = create_graph(node, getThemes()[theme_name], max_nodes)
+    return dot.source, hidden
+
+# Function to raise a field's node budget, run by its "Show more" button before the rerun
+def show_more_nodes(budget_key):
+    st.session_state[budget_key] = st.session_state.get(budget_key, DEFAULT_NODE_BUDGET) + DEFAULT_NODE_BUDGET
+
 st.title('Data Lineage Visualization')
 
 st.sidebar.header('Configuration')
 themes = getThemes()
 theme_name = st.sidebar.selectbox('Select Theme', list(themes.keys()), index=0)
-theme = themes[theme_name]
+db_depth = int(st.sidebar.number_input('DB lineage depth', min_value=1, value=DEFAULT_DB_LINEAGE_DEPTH,
+                                       help='Database lineage levels to follow from each column'))
 
 with st.spinner('Loading lineage data...'):
     try:
-        with open('combined_lineage.json', 'r') as f:
-            lineage_data = json.load(f)
+        lineage_mtime = os.path.getmtime(LINEAGE_FILE)
+        lineage_data = load_lineage_data(LINEAGE_FILE, lineage_mtime)
     except Exception as e:
         st.error(f"Error loading JSON file: {e}")
         st.stop()
 
-workbook_names = [wb['name'] for wb in lineage_data.get('workbooks', [])]
-selected_workbook = st.sidebar.selectbox('Select a Workbook', workbook_names)
-selected_workbook_data = next(wb for wb in lineage_data['workbooks'] if wb['name'] == selected_workbook)
+lineage_index = get_lineage_index(LINEAGE_FILE, lineage_mtime)
 
-dashboard_names = [db['name'] for db in selected_workbook_data['dashboards']]
-selected_dashboard = st.sidebar.selectbox('Select a Dashboard', dashboard_names)
-selected_dashboard_data = next(db for db in selected_workbook_data['dashboards'] if db['name'] == selected_dashboard)
+selected_workbook = st.sidebar.selectbox('Select a Workbook', list(lineage_index))
+dashboards = lineage_index[selected_workbook][1] if selected_workbook is not None else {}
 
-datasource_names = [ds['name'] for ds in selected_dashboard_data['upstreamDatasources']]
-selected_datasource = st.sidebar.selectbox('Select a Datasource', datasource_names)
-selected_datasource_data = next(ds for ds in selected_dashboard_data['upstreamDatasources'] if ds['name'] == selected_datasource)
+selected_dashboard = st.sidebar.selectbox('Select a Dashboard', list(dashboards))
+datasources = dashboards[selected_dashboard][1] if selected_dashboard is not None else {}
 
-sheet_names = [sheet['name'] for sheet in selected_datasource_data['sheets']]
-selected_sheet = st.sidebar.selectbox('Select a Sheet', sheet_names)
-selected_sheet_data = next(sheet for sheet in selected_datasource_data['sheets'] if sheet['name'] == selected_sheet)
+selected_datasource = st.sidebar.selectbox('Select a Datasource', list(datasources))
+sheets = datasources[selected_datasource][1] if selected_datasource is not None else {}
 
-fields = selected_sheet_data.get('upstreamFields', [])
-field_names = [field['name'] for field in fields]
-selected_fields = st.sidebar.multiselect('Select Fields', field_names, default=field_names)
+selected_sheet = st.sidebar.selectbox('Select a Sheet', list(sheets))
+fields = sheets[selected_sheet][1] if selected_sheet is not None else {}
 
-for field in fields:
-    if field['name'] in selected_fields:
-        with st.expander(f"{field['name']}", expanded=True):
-            selected_node = build_lineage_tree(field)
-            dot = create_graph(selected_node, theme)
-            st.graphviz_chart(dot, use_container_width=True)
+field_names = list(fields)
+selected_fields = st.sidebar.multiselect('Select Fields', field_names, default=field_names)
+shown_fields = [field_name for field_name in field_names if field_name in selected_fields]
+
+# Only the current page of fields gets expanders
+page_count = max(1, -(-len(shown_fields) // FIELDS_PER_PAGE))
+page = 1
+if page_count > 1:
+    page = int(st.sidebar.number_input(f'Fields page (of {page_count})', min_value=1, max_value=page_count, value=1))
+    st.caption(f"Showing fields {(page - 1) * FIELDS_PER_PAGE + 1}-{min(page * FIELDS_PER_PAGE, len(shown_fields))} "
+               f"of {len(shown_fields)}")
+
+# A field's graph is built only once its "Show lineage" box is ticked
+field_path = f"{selected_workbook}/{selected_dashboard}/{selected_datasource}/{selected_sheet}"
+for field_name in shown_fields[(page - 1) * FIELDS_PER_PAGE:page * FIELDS_PER_PAGE]:
+    show_key = f"show:{field_path}/{field_name}"
+    budget_key = f"budget:{field_path}/{field_name}"
+    with st.expander(f"{field_name}", expanded=st.session_state.get(show_key, False)):
+        if not st.checkbox('Show lineage', key=show_key):
+            continue
+        max_nodes = st.session_state.get(budget_key, DEFAULT_NODE_BUDGET)
+        dot, hidden = get_lineage_dot(LINEAGE_FILE, lineage_mtime, selected_workbook, selected_dashboard,
+                                      selected_datasource, selected_sheet, field_name, db_depth, theme_name, max_nodes)
+        st.graphviz_chart(dot, use_container_width=True)
+        if hidden:
+            st.button(f"Show more ({hidden} nodes hidden)", key=f"more:{field_path}/{field_name}",
+                      on_click=show_more_nodes, args=(budget_key,))
@@ -0,0 +1,39 @@
+import contextlib
+import io
+import json
+import time
+
+import combined_lineage_db_tableau as merge
+import gojs_transformed_lineage as gojs
+from bench_lineage_merge import build_synthetic_inputs
+
+# Workbook counts to benchmark; node counts grow with them
+WORKBOOK_COUNTS = [1, 10, 100, 500, 2000]
+
+# Function to time apply_tree_layout on a freshly generated model
+def time_layout(transformed):
+    start = time.perf_counter()
+    gojs.apply_tree_layout(transformed)
+    return time.perf_counter() - start
+
+def main():
+    with open('tableau_lineage.json', 'r') as f:
+        tableau_data = json.load(f)
+    with open('lineage.json', 'r') as f:
+        db_lineage_data = json.load(f)
+
+    print(f"{'workbooks':>10} {'tree nodes':>11} {'tree (s)':>9} {'graph nodes':>12} {'graph (s)':>10}")
+    for workbook_count in WORKBOOK_COUNTS:
+        synthetic_tableau, synthetic_db_lineage = build_synthetic_inputs(tableau_data, db_lineage_data, workbook_count)
+        with contextlib.redirect_stdout(io.StringIO()):
+            combined = merge.merge_lineage(synthetic_tableau, synthetic_db_lineage)
+
+        tree = gojs.generate_nodes(combined['workbooks'])
+        graph = gojs.generate_graph(combined['workbooks'])
+        tree_seconds = time_layout(tree)
+        graph_seconds = time_layout(graph)
+        print(f"{workbook_count:>10} {len(tree):>11} {tree_seconds:>9.4f} "
+              f"{len(graph['nodeDataArray']):>12} {graph_seconds:>10.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import contextlib
+import copy
+import io
+import json
+import time
+
+import combined_lineage_db_tableau as merge
+
+# Workbook counts to benchmark
+WORKBOOK_COUNTS = [1, 10, 50, 200]
+
+# The original recursive scan, kept here for comparison
+def linear_find_matching_db_lineage(tableau_column, tableau_table, db_lineage):
+    for db_entry in db_lineage:
+        if tableau_column.lower() == db_entry["column"].lower() and tableau_table.lower() == db_entry["model"].lower():
+            return db_entry
+        matching_upstream = linear_find_matching_db_lineage(tableau_column, tableau_table, db_entry.get("upstream_models", []))
+        if matching_upstream:
+            return matching_upstream
+    return None
+
+# Function to rename every model in a lineage subtree with a suffix
+def suffix_models(db_entry, suffix):
+    db_entry["model"] = f"{db_entry['model']}{suffix}"
+    for upstream_model in db_entry.get("upstream_models", []):
+        suffix_models(upstream_model, suffix)
+
+# Function to build N copies of the sample workbooks, each with its own database models
+def build_synthetic_inputs(tableau_data, db_lineage_data, workbook_count):
+    """
+    Each copy gets table names suffixed with its index, so the database lineage
+    grows with the workbook count just like on a real site.
+    """
+    synthetic_tableau = {"workbooks": []}
+    synthetic_db_lineage = []
+    for index in range(workbook_count):
+        suffix = f"_{index}"
+        for db_entry in copy.deepcopy(db_lineage_data):
+            suffix_models(db_entry, suffix)
+            synthetic_db_lineage.append(db_entry)
+        for workbook in copy.deepcopy(tableau_data["workbooks"]):
+            workbook["name"] = f"{workbook['name']}{suffix}"
+            for dashboard in workbook["dashboards"]:
+                for datasource in dashboard["upstreamDatasources"]:
+                    for sheet in datasource["sheets"]:
+                        for upstream_field in sheet["upstreamFields"]:
+                            for field in [upstream_field] + upstream_field.get("upstreamFields", []):
+                                for column in field.get("upstreamColumns", []):
+                                    for table in column.get("upstreamTables", []):
+                                        table["name"] = f"{table['name']}{suffix}"
+            synthetic_tableau["workbooks"].append(workbook)
+    return synthetic_tableau, synthetic_db_lineage
+
+# Function to time merge_lineage, optionally with the original linear matcher
+def time_merge(tableau_data, db_lineage_data, linear=False):
+    original_functions = (merge.build_db_lineage_index, merge.find_matching_db_lineage)
+    if linear:
+        # Route the lookups through the original scan over the raw lineage list
+        merge.build_db_lineage_index = lambda db_lineage: db_lineage
+        merge.find_matching_db_lineage = linear_find_matching_db_lineage
+    try:
+        data = copy.deepcopy(tableau_data)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            merge.merge_lineage(data, db_lineage_data)
+        return time.perf_counter() - start
+    finally:
+        merge.build_db_lineage_index, merge.find_matching_db_lineage = original_functions
+
+def main():
+    with open('tableau_lineage.json', 'r') as f:
+        tableau_data = json.load(f)
+    with open('lineage.json', 'r') as f:
+        db_lineage_data = json.load(f)
+
+    print(f"{'workbooks':>10} {'indexed (s)':>12} {'linear (s)':>12} {'speedup':>8}")
+    for workbook_count in WORKBOOK_COUNTS:
+        synthetic_tableau, synthetic_db_lineage = build_synthetic_inputs(tableau_data, db_lineage_data, workbook_count)
+        indexed_seconds = time_merge(synthetic_tableau, synthetic_db_lineage)
+        linear_seconds = time_merge(synthetic_tableau, synthetic_db_lineage, linear=True)
+        print(f"{workbook_count:>10} {indexed_seconds:>12.4f} {linear_seconds:>12.4f} "
+              f"{linear_seconds / indexed_seconds:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
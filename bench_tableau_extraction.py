@@ -0,0 +1,88 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import process_tableau_metadata
+import workbook_lineage
+from tableau_standin_server import SyntheticResolver, build_synthetic_site, load_fixtures, start_server
+
+# workbook_lineage settings to compare: (label, batch size, concurrency)
+WORKBOOK_LINEAGE_SCENARIOS = [
+    ("per-workbook, sequential", 1, 1),
+    ("per-workbook, concurrent", 1, workbook_lineage.DEFAULT_CONCURRENCY),
+    ("batched, concurrent", workbook_lineage.WORKBOOK_BATCH_SIZE, workbook_lineage.DEFAULT_CONCURRENCY),
+]
+
+# Function to time a callable with its output silenced, returning (seconds, requests, result)
+def timed(server, function):
+    server.reset_counts()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function()
+    seconds = time.perf_counter() - start
+    graphql_requests = sum(count for operation, count in server.request_counts.items()
+                           if operation not in ("signin", "signout"))
+    return seconds, graphql_requests, result
+
+def bench_workbook_lineage(server, workbook_names, page_size):
+    for label, batch_size, concurrency in WORKBOOK_LINEAGE_SCENARIOS:
+        def run():
+            with workbook_lineage.create_client(pool_size=concurrency) as client:
+                return sum(len(df) for _, df in workbook_lineage.iter_workbook_lineage(
+                    client, workbook_names, batch_size, concurrency, page_size))
+        seconds, graphql_requests, rows = timed(server, run)
+        print(f"{'workbook_lineage: ' + label:<52} {seconds:>9.3f} {graphql_requests:>9} {rows:>9}")
+
+def bench_process_tableau_metadata(server, workbook_name):
+    process_tableau_metadata.WORKBOOK_NAME = workbook_name
+
+    seconds, graphql_requests, lineage = timed(server, process_tableau_metadata.extract_tableau_lineage)
+    print(f"{'process_tableau_metadata: full':<52} {seconds:>9.3f} {graphql_requests:>9} {len(lineage['workbooks']):>9}")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_path = os.path.join(cache_dir, "cache.sqlite")
+        for label in ("incremental, cold cache", "incremental, warm cache"):
+            seconds, graphql_requests, workbook_entries = timed(
+                server, lambda: process_tableau_metadata.refresh_tableau_lineage(cache_path))
+            print(f"{'process_tableau_metadata: ' + label:<52} {seconds:>9.3f} {graphql_requests:>9} "
+                  f"{len(workbook_entries):>9}")
+
+    for concurrency in (1, process_tableau_metadata.DEFAULT_CONCURRENCY):
+        seconds, graphql_requests, workbook_entries = timed(
+            server, lambda: process_tableau_metadata.extract_site_lineage(concurrency))
+        label = f"site-wide, concurrency {concurrency}"
+        print(f"{'process_tableau_metadata: ' + label:<52} {seconds:>9.3f} {graphql_requests:>9} "
+              f"{len(workbook_entries):>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Tableau extraction offline against the stand-in server.")
+    parser.add_argument("--workbooks", type=int, default=20)
+    parser.add_argument("--sheets", type=int, default=10)
+    parser.add_argument("--calcs", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="delay the stand-in adds to every request")
+    parser.add_argument("--page-size", type=int, default=workbook_lineage.DEFAULT_PAGE_SIZE)
+    parser.add_argument("--fixtures", help="also replay fixtures recorded with TABLEAU_RECORD_DIR")
+    args = parser.parse_args()
+
+    site = build_synthetic_site(args.workbooks, args.sheets, args.calcs)
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else {}
+    server = start_server(fixtures=fixtures, resolver=SyntheticResolver(site), latency=args.latency_ms / 1000)
+    # create_client reads the module-level server_url at call time
+    workbook_lineage.server_url = server.url
+    process_tableau_metadata.server_url = server.url
+
+    print(f"Synthetic site: {args.workbooks} workbooks x {args.sheets} sheets x {args.calcs} calcs, "
+          f"{args.latency_ms:g} ms latency")
+    print(f"{'scenario':<52} {'seconds':>9} {'requests':>9} {'output':>9}")
+    try:
+        bench_workbook_lineage(server, [wb["name"] for wb in site["workbooks"]], args.page_size)
+        bench_process_tableau_metadata(server, site["workbooks"][0]["name"])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
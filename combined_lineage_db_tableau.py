@@ -1,34 +1,30 @@
+import argparse
 import json
 
-# Load Tableau lineage
-with open('tableau_lineage.json', 'r') as f:
-    tableau_data = json.load(f)
-
-# Load Database lineage
-with open('lineage.json', 'r') as f:
-    db_lineage_data = json.load(f)
+# Function to index database lineage by (model, column), including nested upstream models
+def build_db_lineage_index(db_lineage):
+    """
+    Returns {(lower(model), lower(column)): lineage node}. Nodes are visited in the
+    same depth-first order as the old recursive scan and the first node wins, so
+    lookups return exactly what the scan used to.
+    """
+    index = {}
+    stack = list(reversed(db_lineage))
+    while stack:
+        db_entry = stack.pop()
+        index.setdefault((db_entry["model"].lower(), db_entry["column"].lower()), db_entry)
+        stack.extend(reversed(db_entry.get("upstream_models", [])))
+    return index
 
-# Helper function to recursively find matching column and table in database lineage
-def find_matching_db_lineage(tableau_column, tableau_table, db_lineage):
+# Helper function to find matching column and table in database lineage
+def find_matching_db_lineage(tableau_column, tableau_table, db_lineage_index):
     """
     Finds a matching column in the db_lineage based on both column and table name.
-    Recursively searches upstream models if no direct match is found.
     """
-    for db_entry in db_lineage:
-        if tableau_column.lower() == db_entry["column"].lower() and tableau_table.lower() == db_entry["model"].lower():
-            return db_entry
-        
-        # If there are upstream models, recursively search them
-        upstream_models = db_entry.get("upstream_models", [])
-        if upstream_models:
-            matching_upstream = find_matching_db_lineage(tableau_column, tableau_table, upstream_models)
-            if matching_upstream:
-                return matching_upstream
-    
-    return None
+    return db_lineage_index.get((tableau_table.lower(), tableau_column.lower()))
 
 # Recursive function to process upstream fields and match to database lineage
-def process_upstream_fields(upstream_fields, db_lineage_data, context=""):
+def process_upstream_fields(upstream_fields, db_lineage_index, context=""):
     """
     Processes upstream fields recursively, comparing upstream columns and tables with database lineage.
     Handles nested upstreamTables inside upstreamColumns.
@@ -42,7 +38,7 @@ def process_upstream_fields(upstream_fields, db_lineage_data, context=""):
             
             for upstream_table in upstream_tables:
                 # Find matching database lineage using both the column and table
-                matching_db_lineage = find_matching_db_lineage(upstream_column["name"], upstream_table["name"], db_lineage_data)
+                matching_db_lineage = find_matching_db_lineage(upstream_column["name"], upstream_table["name"], db_lineage_index)
                 if matching_db_lineage:
                     # Add the matched DB lineage details to the Tableau upstream column
                     upstream_column["database_lineage"] = matching_db_lineage
@@ -55,27 +51,30 @@ def process_upstream_fields(upstream_fields, db_lineage_data, context=""):
         # Recursively process nested upstreamFields if present
         nested_upstream_fields = upstream_field.get("upstreamFields", [])
         if nested_upstream_fields:
-            process_upstream_fields(nested_upstream_fields, db_lineage_data, context=f"{context} -> Nested Field")
+            process_upstream_fields(nested_upstream_fields, db_lineage_index, context=f"{context} -> Nested Field")
 
 # Function to process non-calculated columns
-def process_non_calculated_fields(datasource, db_lineage_data):
+def process_non_calculated_fields(datasource, db_lineage_index):
     """
     Handles fields that are not part of calculations and ensures their upstream lineage is correctly processed.
     """
     for sheet in datasource["sheets"]:
         for upstream_field in sheet["upstreamFields"]:
-            process_upstream_fields([upstream_field], db_lineage_data, context=f"Sheet: {sheet['name']}")
+            process_upstream_fields([upstream_field], db_lineage_index, context=f"Sheet: {sheet['name']}")
 
 # Function to merge database lineage into Tableau lineage
 def merge_lineage(tableau_data, db_lineage_data):
     """
     Iterates over the Tableau lineage and matches it with the database lineage.
     """
+    # Index the database lineage once so every match is a dict lookup
+    db_lineage_index = build_db_lineage_index(db_lineage_data)
+
     for workbook in tableau_data["workbooks"]:
         for dashboard in workbook["dashboards"]:
             for datasource in dashboard["upstreamDatasources"]:
                 # Process non-calculated fields
-                process_non_calculated_fields(datasource, db_lineage_data)
+                process_non_calculated_fields(datasource, db_lineage_index)
 
                 # Process referencedByCalculations if they exist
                 for sheet in datasource["sheets"]:
@@ -83,15 +82,112 @@ def merge_lineage(tableau_data, db_lineage_data):
                         if "referencedByCalculations" in upstream_field:
                             for calc in upstream_field["referencedByCalculations"]:
                                 # Process upstreamFields within referenced calculations
-                                process_upstream_fields(calc.get("upstreamFields", []), db_lineage_data, context=f"Calculation in Sheet: {sheet['name']}")
+                                process_upstream_fields(calc.get("upstreamFields", []), db_lineage_index, context=f"Calculation in Sheet: {sheet['name']}")
 
     return tableau_data
 
-# Merge the lineages
-combined_lineage = merge_lineage(tableau_data, db_lineage_data)
+# Function to build the key a Tableau column uses to reference a DB lineage node
+def db_lineage_key(db_entry):
+    return f"{db_entry['model']}.{db_entry['column']}".upper()
+
+# Function to add a DB lineage subtree to the shared table, one flat entry per node
+def add_to_db_lineage_table(db_entry, db_lineage_table):
+    """
+    Each node is stored once, with its upstream models replaced by 'upstream_refs'
+    (keys into the same table). Returns the key of db_entry.
+    """
+    stack = [db_entry]
+    while stack:
+        node = stack.pop()
+        key = db_lineage_key(node)
+        if key in db_lineage_table:
+            continue
+        upstream_models = node.get("upstream_models", [])
+        flat_node = {name: value for name, value in node.items() if name != "upstream_models"}
+        flat_node["upstream_refs"] = [db_lineage_key(upstream_model) for upstream_model in upstream_models]
+        db_lineage_table[key] = flat_node
+        stack.extend(upstream_models)
+    return db_lineage_key(db_entry)
+
+# Function to replace embedded DB lineage subtrees with references into a top-level table
+def convert_to_db_lineage_references(combined_lineage):
+    """
+    Moves every upstream_column["database_lineage"] subtree into
+    combined_lineage["database_lineage"] and leaves a "database_lineage_ref" key
+    behind, so a dbt column used by many Tableau fields is serialized once.
+    """
+    db_lineage_table = combined_lineage.setdefault("database_lineage", {})
+    stack = [combined_lineage["workbooks"]]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            stack.extend(item)
+        elif isinstance(item, dict):
+            db_entry = item.pop("database_lineage", None)
+            if isinstance(db_entry, dict):
+                item["database_lineage_ref"] = add_to_db_lineage_table(db_entry, db_lineage_table)
+            stack.extend(value for value in item.values() if isinstance(value, (list, dict)))
+    return combined_lineage
+
+# Function to rebuild the nested DB lineage node for a reference
+def resolve_db_lineage_ref(ref, db_lineage_table, resolved):
+    """
+    Returns the node in the embedded format (nested 'upstream_models'), or None for
+    an unknown key. resolved memoizes nodes across calls, so shared subtrees are
+    only built once and only when a caller actually asks for them.
+    """
+    if ref in resolved:
+        return resolved[ref]
+    flat_node = db_lineage_table.get(ref)
+    if flat_node is None:
+        return None
+    node = {name: value for name, value in flat_node.items() if name != "upstream_refs"}
+    resolved[ref] = node
+    node["upstream_models"] = [
+        upstream_node for upstream_node in (
+            resolve_db_lineage_ref(upstream_ref, db_lineage_table, resolved)
+            for upstream_ref in flat_node.get("upstream_refs", [])
+        ) if upstream_node is not None
+    ]
+    return node
+
+# Function to get the DB lineage of a Tableau upstream column in either output mode
+def get_column_db_lineage(upstream_column, db_lineage_table, resolved):
+    if "database_lineage" in upstream_column:
+        return upstream_column["database_lineage"]
+    ref = upstream_column.get("database_lineage_ref")
+    if ref is None:
+        return None
+    return resolve_db_lineage_ref(ref, db_lineage_table, resolved)
+
+# Main function to merge the lineage files
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge database lineage into Tableau lineage.")
+    parser.add_argument(
+        "--db-lineage-mode", choices=["embed", "reference"], default="embed",
+        help="embed: copy the DB lineage subtree into every matching Tableau column; "
+             "reference: store each DB lineage node once under 'database_lineage' and reference it by key"
+    )
+    args = parser.parse_args(argv)
+
+    # Load Tableau lineage
+    with open('tableau_lineage.json', 'r') as f:
+        tableau_data = json.load(f)
+
+    # Load Database lineage
+    with open('lineage.json', 'r') as f:
+        db_lineage_data = json.load(f)
+
+    # Merge the lineages
+    combined_lineage = merge_lineage(tableau_data, db_lineage_data)
+    if args.db_lineage_mode == "reference":
+        combined_lineage = convert_to_db_lineage_references(combined_lineage)
+
+    # Output the merged lineage to a file
+    with open('combined_lineage.json', 'w') as f:
+        json.dump(combined_lineage, f, indent=4)
 
-# Output the merged lineage to a file
-with open('combined_lineage.json', 'w') as f:
-    json.dump(combined_lineage, f, indent=4)
+    print("Merged lineage file generated successfully.")
 
-print("Merged lineage file generated successfully.")
+if __name__ == "__main__":
+    main()
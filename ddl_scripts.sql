@@ -41,4 +41,28 @@ create or replace TABLE JAFFLE_LINEAGE.LINEAGE_DATA.COLUMN_LINEAGE_CORTEX (
 	SOURCE_SCHEMA VARCHAR(255),
 	SOURCE_COLUMNS VARCHAR(255),
 	TRANSFORMATION VARCHAR(16777216)
-);
\ No newline at end of file
+);
+
+create or replace TABLE JAFFLE_LINEAGE.LINEAGE_DATA.CORTEX_TIER_STATS (
+	MODEL_NAME VARCHAR(255),
+	DATABASE_NAME VARCHAR(255),
+	SCHEMA_NAME VARCHAR(255),
+	TABLE_NAME VARCHAR(255),
+	ATTEMPT_KIND VARCHAR(16),  -- full, reask
+	SUCCESS BOOLEAN,
+	LATENCY_SECONDS FLOAT,
+	FAILURE_REASON VARCHAR(16777216),
+	CREATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+);
+
+
+create or replace TABLE JAFFLE_LINEAGE.LINEAGE_DATA.LINEAGE_WORK_QUEUE (
+	DATABASE_NAME VARCHAR(255),
+	SCHEMA_NAME VARCHAR(255),
+	TABLE_NAME VARCHAR(255),
+	SQL_HASH VARCHAR(64),
+	STATE VARCHAR(16),  -- pending, in_flight, done, failed
+	ATTEMPTS NUMBER DEFAULT 0,
+	LAST_ERROR VARCHAR(16777216),
+	UPDATED_AT TIMESTAMP_NTZ
+);
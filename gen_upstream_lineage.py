@@ -2,143 +2,379 @@ from snowflake.snowpark.session import Session
 from snowflake.snowpark.functions import call_builtin
 import json
 import re
+import time
 import logging
 
-# Configure logging for better debugging and visibility
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
-
-# Get the active Snowpark session (in a Snowflake notebook, the session is usually already available)
-session = Session.builder.getOrCreate()
+from lineage_prompt import build_lineage_prompts, build_followup_prompt, stitch_partial_lineages
 
 # Define the table names (replace with your actual table names if different)
 TABLE_SCHEMA_REF = 'JAFFLE_LINEAGE.LINEAGE_DATA.TABLE_SCHEMA_REF'
 COLUMN_LINEAGE_CORTEX = 'JAFFLE_LINEAGE.LINEAGE_DATA.COLUMN_LINEAGE_CORTEX'
+CORTEX_TIER_STATS = 'JAFFLE_LINEAGE.LINEAGE_DATA.CORTEX_TIER_STATS'
+LINEAGE_WORK_QUEUE = 'JAFFLE_LINEAGE.LINEAGE_DATA.LINEAGE_WORK_QUEUE'
+COLUMN_LINEAGE_STAGING = 'JAFFLE_LINEAGE.LINEAGE_DATA.COLUMN_LINEAGE_CORTEX_STAGING'
 
-# Fetch distinct combinations of DATABASE, SCHEMA, TABLE_NAME, COLUMN_NAME, EXPANDED_SQL
-df = session.sql(f"""
-    SELECT DISTINCT DATABASE, SCHEMA, TABLE_NAME, COLUMN_NAME, EXPANDED_SQL
-    FROM {TABLE_SCHEMA_REF}
-    WHERE EXPANDED_SQL IS NOT NULL
-""")
-
-rows = df.collect()
-
-for row in rows:
-    input_record = row.as_dict()
-    sql_query = input_record['EXPANDED_SQL']
-    
-    composite_key = {
-        'DATABASE_NAME': input_record['DATABASE'],
-        'SCHEMA_NAME': input_record['SCHEMA'],
-        'TABLE_NAME': input_record['TABLE_NAME'],
-        'FINAL_COLUMN': input_record['COLUMN_NAME']
-    }
-    
-    # Check if the record already exists in the target table
-    check_query = f"""
-        SELECT EXPANDED_SQL
-        FROM {COLUMN_LINEAGE_CORTEX}
-        WHERE DATABASE_NAME = '{composite_key['DATABASE_NAME']}'
-        AND SCHEMA_NAME = '{composite_key['SCHEMA_NAME']}'
-        AND TABLE_NAME = '{composite_key['TABLE_NAME']}'
-        AND FINAL_COLUMN = '{composite_key['FINAL_COLUMN']}'
-    """
-    
-    existing_record_df = session.sql(check_query)
-    existing_records = existing_record_df.collect()
-    
-    if existing_records:
-        existing_sql = existing_records[0]['EXPANDED_SQL']
-        if existing_sql == sql_query:
-            logging.info(f"SQL unchanged for {composite_key}. Skipping record.")
-            continue  # Skip processing if the SQL is the same
-        else:
-            logging.info(f"SQL changed for {composite_key}. Deleting old records.")
-            # SQL has changed, so delete existing records with this composite key
-            delete_query = f"""
-                DELETE FROM {COLUMN_LINEAGE_CORTEX}
-                WHERE DATABASE_NAME = '{composite_key['DATABASE_NAME']}'
-                AND SCHEMA_NAME = '{composite_key['SCHEMA_NAME']}'
-                AND TABLE_NAME = '{composite_key['TABLE_NAME']}'
-                AND FINAL_COLUMN = '{composite_key['FINAL_COLUMN']}'
-            """
-            try:
-                session.sql(delete_query).collect()
-            except Exception as e:
-                logging.error(f"Error deleting existing records: {e}")
-                continue  # Skip to next record
-    else:
-        logging.info(f"New record for {composite_key}. Processing.")
-    
-    # Now process the SQL query using Cortex LLM to generate lineage information
-    # Construct the prompt for the Cortex LLM
-    prompt = (
-        "You are an expert in SQL lineage analysis. "
-        "Given the following SQL query, identify the source tables and columns for each final column in the SELECT statement. "
-        "Additionally, provide simple reasoning in business-friendly language explaining the transformation for each column. "
-        "Provide the results as a JSON array of objects, where each object has the keys: FINAL_COLUMN, SOURCE_TABLE, SOURCE_DATABASE, SOURCE_SCHEMA, SOURCE_COLUMNS, and REASONING. "
-        "SQL Query: " + sql_query
-    )
+# Cortex models to try, cheapest/fastest first. A tier's answer is only accepted
+# once every projected column has a valid record; otherwise the next tier is tried.
+MODEL_TIERS = ['llama3.1-8b', 'llama3.1-70b', 'llama3.1-405b']
 
-    # Escape single quotes in the prompt
-    prompt = prompt.replace("'", "''")
+# Follow-up prompts per tier for columns that were missing or invalid before escalating
+MAX_REASKS_PER_TIER = 1
 
-    # Call the Cortex LLM using the SNOWFLAKE.CORTEX.COMPLETE function
-    try:
-        lineage_response_df = session.sql(f"""
-            SELECT SNOWFLAKE.CORTEX.COMPLETE(
-                'llama3.1-405b',  -- You can change the model if needed
-                '{prompt}'
-            ) AS LINEAGE_RESPONSE
-        """)
-        lineage_response_row = lineage_response_df.collect()[0]
-        lineage_response = lineage_response_row['LINEAGE_RESPONSE']
-    except Exception as e:
-        logging.error(f"Error calling Cortex LLM: {e}")
-        continue  # Skip to the next SQL query
+# Keys every lineage record returned by the LLM must contain
+LINEAGE_RECORD_KEYS = ('FINAL_COLUMN', 'SOURCE_TABLE', 'SOURCE_DATABASE', 'SOURCE_SCHEMA', 'SOURCE_COLUMNS', 'REASONING')
 
-    # Try to extract the JSON data from the response
+# Function to call a single Cortex model and return the raw text response
+def call_cortex(session, model, prompt):
+    # Escape single quotes in the prompt
+    escaped_prompt = prompt.replace("'", "''")
+    lineage_response_df = session.sql(f"""
+        SELECT SNOWFLAKE.CORTEX.COMPLETE(
+            '{model}',
+            '{escaped_prompt}'
+        ) AS LINEAGE_RESPONSE
+    """)
+    return lineage_response_df.collect()[0]['LINEAGE_RESPONSE']
+
+# Function to extract the JSON array of lineage records from an LLM response
+def parse_lineage_response(lineage_response):
+    """
+    Returns the parsed list of records. If the array itself is malformed (e.g. a
+    truncated response), every well-formed object inside it is salvaged. Raises
+    ValueError (json.JSONDecodeError is a subclass) if nothing can be parsed.
+    """
     try:
         # Use regex to extract JSON array from the response
         json_match = re.search(r'\[.*\]', lineage_response, re.DOTALL)
         if json_match:
-            json_data = json_match.group(0)
-            parsed_records = json.loads(json_data)
+            parsed_records = json.loads(json_match.group(0))
         else:
             # Try to parse the entire response if it is valid JSON
             parsed_records = json.loads(lineage_response)
-    except json.JSONDecodeError as e:
-        logging.error(f"Error parsing JSON response: {e}")
-        logging.error(f"Response: {lineage_response}")
-        continue  # Skip to the next SQL query
+        if not isinstance(parsed_records, list):
+            raise ValueError("Response JSON is not an array")
+        return parsed_records
+    except ValueError:
+        salvaged_records = []
+        for object_text in re.findall(r'\{[^{}]*\}', lineage_response):
+            try:
+                salvaged_records.append(json.loads(object_text))
+            except json.JSONDecodeError:
+                continue
+        if not salvaged_records:
+            raise
+        return salvaged_records
 
-    # Insert the parsed records into the COLUMN_LINEAGE_CORTEX table
+# Function to diff parsed records against the expected schema and projected columns
+def diff_lineage_records(parsed_records, expected_columns):
+    """
+    Returns (valid_records, missing_columns, problems).
+    valid_records maps an upper-cased FINAL_COLUMN to its record. missing_columns
+    holds the expected columns with no valid record, plus any column whose record
+    was malformed. expected_columns may be empty when the projection is unknown,
+    in which case any well-formed record is accepted.
+    """
+    valid_records = {}
+    invalid_columns = set()
+    problems = []
     for record in parsed_records:
-        # Prepare the data for insertion
-        insert_data = {
-            'DATABASE_NAME': composite_key['DATABASE_NAME'],
-            'SCHEMA_NAME': composite_key['SCHEMA_NAME'],
-            'TABLE_NAME': composite_key['TABLE_NAME'],
-            'REFERENCE': None,  # If REFERENCE is needed, you can fetch it from source if available
-            'EXPANDED_SQL': sql_query,
-            'FINAL_COLUMN': record.get('FINAL_COLUMN', 'Unknown'),
-            'SOURCE_TABLE': record.get('SOURCE_TABLE', 'Unknown'),
-            'SOURCE_DATABASE': record.get('SOURCE_DATABASE', 'Unknown'),
-            'SOURCE_SCHEMA': record.get('SOURCE_SCHEMA', 'Unknown'),
-            'SOURCE_COLUMNS': ', '.join(record.get('SOURCE_COLUMNS', [])) if isinstance(record.get('SOURCE_COLUMNS'), list) else record.get('SOURCE_COLUMNS', 'Unknown'),
-            'REASONING': record.get('REASONING', 'Unknown')
+        if not isinstance(record, dict):
+            problems.append(f"Record is not an object: {record!r}")
+            continue
+        final_column = record.get('FINAL_COLUMN')
+        if not isinstance(final_column, str) or not final_column.strip():
+            problems.append(f"Record has no FINAL_COLUMN: {record!r}")
+            continue
+        final_column = final_column.strip().upper()
+        if expected_columns and final_column not in expected_columns:
+            problems.append(f"Unknown FINAL_COLUMN: {final_column}")
+            continue
+        missing_keys = [key for key in LINEAGE_RECORD_KEYS if key not in record]
+        if missing_keys:
+            problems.append(f"Record for {final_column} is missing keys {missing_keys}")
+            invalid_columns.add(final_column)
+            continue
+        valid_records.setdefault(final_column, record)
+
+    missing_columns = (set(expected_columns) | invalid_columns) - valid_records.keys()
+    if missing_columns:
+        problems.append(f"Missing FINAL_COLUMNs: {sorted(missing_columns)}")
+    return valid_records, missing_columns, problems
+
+# Function to run a prompt through MODEL_TIERS until every column has valid lineage
+def complete_with_escalation(session, chunk, expected_columns, composite_key, tier_stats):
+    """
+    Valid records are kept across attempts. While columns are still missing or
+    invalid, each tier is re-asked with a compact follow-up prompt for just those
+    columns, and the next tier only receives the follow-up for what remains.
+    Returns (records, model) once every column is covered, or (None, None) if every
+    tier failed. One entry per attempt is appended to tier_stats.
+    """
+    accepted_records = {}
+    missing_columns = set(expected_columns)
+    for model in MODEL_TIERS:
+        for reask in range(MAX_REASKS_PER_TIER + 1):
+            if accepted_records:
+                prompt = build_followup_prompt(chunk, missing_columns)
+                attempt_kind = 'reask'
+            else:
+                prompt = chunk['prompt']
+                attempt_kind = 'full'
+
+            start = time.perf_counter()
+            failure_reason = None
+            try:
+                lineage_response = call_cortex(session, model, prompt)
+                parsed_records = parse_lineage_response(lineage_response)
+                valid_records, invalid_columns, problems = diff_lineage_records(parsed_records, expected_columns)
+                for final_column, record in valid_records.items():
+                    accepted_records.setdefault(final_column, record)
+                missing_columns = (missing_columns | invalid_columns) - accepted_records.keys()
+                if not accepted_records:
+                    failure_reason = '; '.join(problems) or "No lineage records returned"
+                elif missing_columns:
+                    failure_reason = f"Missing FINAL_COLUMNs: {sorted(missing_columns)}"
+            except ValueError as e:
+                failure_reason = f"Unparseable response: {e}"
+            except Exception as e:
+                failure_reason = f"Cortex call failed: {e}"
+            latency = time.perf_counter() - start
+
+            tier_stats.append({
+                'MODEL_NAME': model,
+                'DATABASE_NAME': composite_key['DATABASE_NAME'],
+                'SCHEMA_NAME': composite_key['SCHEMA_NAME'],
+                'TABLE_NAME': composite_key['TABLE_NAME'],
+                'ATTEMPT_KIND': attempt_kind,
+                'SUCCESS': failure_reason is None,
+                'LATENCY_SECONDS': round(latency, 3),
+                'FAILURE_REASON': failure_reason
+            })
+
+            if failure_reason is None:
+                logging.info(f"{model} completed lineage for {composite_key['TABLE_NAME']} ({attempt_kind}) in {latency:.1f}s")
+                return list(accepted_records.values()), model
+            logging.warning(f"{model} {attempt_kind} failed for {composite_key['TABLE_NAME']} after {latency:.1f}s: {failure_reason}")
+
+    return None, None
+
+# Function to persist one model's per-attempt tier statistics as soon as the model finishes
+def save_tier_stats(session, model_stats):
+    """Columns are matched by name, so CREATED_AT falls back to its default."""
+    if not model_stats:
+        return
+    try:
+        session.create_dataframe(model_stats).write.mode('append').save_as_table(
+            CORTEX_TIER_STATS, column_order='name')
+    except Exception as e:
+        logging.error(f"Error writing tier statistics to {CORTEX_TIER_STATS}: {e}")
+
+# Function to log a per-tier summary of the run's attempts
+def log_tier_summary(tier_stats):
+    for model in MODEL_TIERS:
+        attempts = [stat for stat in tier_stats if stat['MODEL_NAME'] == model]
+        if not attempts:
+            continue
+        successes = sum(1 for stat in attempts if stat['SUCCESS'])
+        avg_latency = sum(stat['LATENCY_SECONDS'] for stat in attempts) / len(attempts)
+        logging.info(f"Tier {model}: {successes}/{len(attempts)} succeeded, avg latency {avg_latency:.1f}s")
+
+# Function to quote a value as a SQL string literal
+def sql_literal(value):
+    if value is None:
+        return 'NULL'
+    return "'" + str(value).replace("'", "''") + "'"
+
+# Function to build the WHERE clause selecting one model's rows
+def model_filter(composite_key):
+    return f"""
+        DATABASE_NAME = {sql_literal(composite_key['DATABASE_NAME'])}
+        AND SCHEMA_NAME = {sql_literal(composite_key['SCHEMA_NAME'])}
+        AND TABLE_NAME = {sql_literal(composite_key['TABLE_NAME'])}
+    """
+
+# Function to bring the work queue in line with TABLE_SCHEMA_REF
+def sync_work_queue(session):
+    """
+    One queue row per model, keyed by the hash of its EXPANDED_SQL:
+      - new models are queued as pending (or done if COLUMN_LINEAGE_CORTEX already
+        holds rows for the same SQL, so existing lineage is not regenerated)
+      - models whose SQL changed go back to pending
+      - in_flight rows left by a crashed run and failed rows are retried
+    """
+    session.sql(f"""
+        MERGE INTO {LINEAGE_WORK_QUEUE} q
+        USING (
+            SELECT r.DATABASE AS DATABASE_NAME, r.SCHEMA AS SCHEMA_NAME, r.TABLE_NAME,
+                   SHA2(r.EXPANDED_SQL) AS SQL_HASH,
+                   BOOLOR_AGG(c.TABLE_NAME IS NOT NULL) AS ALREADY_LOADED
+            FROM (SELECT DISTINCT DATABASE, SCHEMA, TABLE_NAME, EXPANDED_SQL
+                  FROM {TABLE_SCHEMA_REF}
+                  WHERE EXPANDED_SQL IS NOT NULL) r
+            LEFT JOIN (SELECT DISTINCT DATABASE_NAME, SCHEMA_NAME, TABLE_NAME, EXPANDED_SQL
+                       FROM {COLUMN_LINEAGE_CORTEX}) c
+              ON c.DATABASE_NAME = r.DATABASE AND c.SCHEMA_NAME = r.SCHEMA
+             AND c.TABLE_NAME = r.TABLE_NAME AND c.EXPANDED_SQL = r.EXPANDED_SQL
+            GROUP BY 1, 2, 3, 4
+        ) s
+        ON q.DATABASE_NAME = s.DATABASE_NAME AND q.SCHEMA_NAME = s.SCHEMA_NAME AND q.TABLE_NAME = s.TABLE_NAME
+        WHEN MATCHED AND q.SQL_HASH <> s.SQL_HASH THEN UPDATE SET
+            SQL_HASH = s.SQL_HASH, STATE = 'pending', ATTEMPTS = 0, LAST_ERROR = NULL, UPDATED_AT = CURRENT_TIMESTAMP()
+        WHEN MATCHED AND q.STATE IN ('in_flight', 'failed') THEN UPDATE SET
+            STATE = 'pending', UPDATED_AT = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT (DATABASE_NAME, SCHEMA_NAME, TABLE_NAME, SQL_HASH, STATE, ATTEMPTS, LAST_ERROR, UPDATED_AT)
+            VALUES (s.DATABASE_NAME, s.SCHEMA_NAME, s.TABLE_NAME, s.SQL_HASH,
+                    IFF(s.ALREADY_LOADED, 'done', 'pending'), 0, NULL, CURRENT_TIMESTAMP())
+    """).collect()
+
+# Function to record a model's state in the work queue
+def set_model_state(session, composite_key, state, error=None):
+    attempts = "ATTEMPTS + 1" if state == 'failed' else "ATTEMPTS"
+    session.sql(f"""
+        UPDATE {LINEAGE_WORK_QUEUE}
+        SET STATE = {sql_literal(state)}, ATTEMPTS = {attempts}, LAST_ERROR = {sql_literal(error)},
+            UPDATED_AT = CURRENT_TIMESTAMP()
+        WHERE {model_filter(composite_key)}
+    """).collect()
+
+# Function to fetch the models still to process, with their SQL and column lists
+def fetch_pending_models(session):
+    rows = session.sql(f"""
+        SELECT r.DATABASE, r.SCHEMA, r.TABLE_NAME, r.COLUMN_NAME, r.EXPANDED_SQL
+        FROM {TABLE_SCHEMA_REF} r
+        JOIN {LINEAGE_WORK_QUEUE} q
+          ON q.DATABASE_NAME = r.DATABASE AND q.SCHEMA_NAME = r.SCHEMA AND q.TABLE_NAME = r.TABLE_NAME
+        WHERE r.EXPANDED_SQL IS NOT NULL
+          AND q.STATE = 'pending'
+    """).collect()
+
+    pending_models = {}
+    for row in rows:
+        model_key = (row['DATABASE'], row['SCHEMA'], row['TABLE_NAME'])
+        model = pending_models.setdefault(model_key, {'sql': row['EXPANDED_SQL'], 'columns': set()})
+        model['columns'].add(row['COLUMN_NAME'].strip().upper())
+    return pending_models
+
+# Function to replace a model's lineage rows and mark it done in one transaction
+def swap_model_lineage(session, composite_key, insert_rows):
+    """
+    Rows are first written to a staging table (that write may run DDL, which
+    would implicitly commit an open transaction). The delete of the old rows,
+    the insert of the new ones and the queue update then commit together.
+    """
+    session.create_dataframe(insert_rows).write.mode('overwrite').save_as_table(COLUMN_LINEAGE_STAGING)
+    try:
+        session.sql("BEGIN").collect()
+        session.sql(f"DELETE FROM {COLUMN_LINEAGE_CORTEX} WHERE {model_filter(composite_key)}").collect()
+        # Positional insert, matching the previous append (REASONING lands in TRANSFORMATION)
+        session.sql(f"INSERT INTO {COLUMN_LINEAGE_CORTEX} SELECT * FROM {COLUMN_LINEAGE_STAGING}").collect()
+        session.sql(f"""
+            UPDATE {LINEAGE_WORK_QUEUE}
+            SET STATE = 'done', LAST_ERROR = NULL, UPDATED_AT = CURRENT_TIMESTAMP()
+            WHERE {model_filter(composite_key)}
+        """).collect()
+        session.sql("COMMIT").collect()
+    except Exception:
+        session.sql("ROLLBACK").collect()
+        raise
+
+# Function to generate Cortex lineage for every pending model
+def generate_cortex_lineage(session):
+    # Queue new/changed models and reset anything a previous run left unfinished
+    sync_work_queue(session)
+    pending_models = fetch_pending_models(session)
+    logging.info(f"{len(pending_models)} model(s) pending lineage generation.")
+
+    tier_stats = []
+
+    for (database, schema, table_name), model_info in pending_models.items():
+        sql_query = model_info['sql']
+        expected_columns = model_info['columns']
+
+        composite_key = {
+            'DATABASE_NAME': database,
+            'SCHEMA_NAME': schema,
+            'TABLE_NAME': table_name
         }
 
-        # Convert the data to a DataFrame
-        insert_df = session.create_dataframe([insert_data])
+        logging.info(f"Processing {composite_key}.")
+        set_model_state(session, composite_key, 'in_flight')
+
+        # Build compacted prompt(s); very large models are split into per-CTE sub-prompts
+        try:
+            prompts, prompt_stats = build_lineage_prompts(sql_query)
+        except Exception as e:
+            logging.error(f"Error building lineage prompts for {composite_key}: {e}")
+            set_model_state(session, composite_key, 'failed', f"Prompt build failed: {e}")
+            continue  # Skip to the next model
+        logging.info(
+            f"Prompt tokens for {composite_key['TABLE_NAME']}: {prompt_stats['raw_tokens']} raw, "
+            f"{prompt_stats['compact_tokens']} compacted"
+            + (f", {prompt_stats['chunked_tokens']} across {prompt_stats['chunks']} CTE prompts"
+               if prompt_stats['chunked_tokens'] is not None else "")
+        )
+
+        # Try the model tiers cheapest first, escalating only when the answer fails validation
+        partial_lineages = {}
+        model_stats = []
+        for chunk in prompts:
+            chunk_columns = chunk['columns'] if chunk['cte_name'] else expected_columns
+            chunk_records, model = complete_with_escalation(session, chunk, chunk_columns, composite_key, model_stats)
+            if chunk_records is None:
+                break
+            partial_lineages[chunk['cte_name']] = chunk_records
+
+        # Persist this model's attempts now, so an aborted run keeps what it measured
+        save_tier_stats(session, model_stats)
+        tier_stats.extend(model_stats)
+
+        if len(partial_lineages) != len(prompts):
+            logging.error(f"No model tier produced valid lineage for {composite_key}")
+            set_model_state(session, composite_key, 'failed', "No model tier produced valid lineage")
+            continue  # Skip to the next model
 
-        # Write the DataFrame to the COLUMN_LINEAGE_CORTEX table
+        if len(prompts) > 1:
+            # Stitch per-CTE answers back into lineage from physical tables
+            parsed_records = stitch_partial_lineages(partial_lineages)
+        else:
+            parsed_records = partial_lineages[None]
+
+        # Prepare the COLUMN_LINEAGE_CORTEX rows for this model
+        insert_rows = []
+        for record in parsed_records:
+            insert_rows.append({
+                'DATABASE_NAME': composite_key['DATABASE_NAME'],
+                'SCHEMA_NAME': composite_key['SCHEMA_NAME'],
+                'TABLE_NAME': composite_key['TABLE_NAME'],
+                'REFERENCE': None,  # If REFERENCE is needed, you can fetch it from source if available
+                'EXPANDED_SQL': sql_query,
+                'FINAL_COLUMN': record.get('FINAL_COLUMN', 'Unknown'),
+                'SOURCE_TABLE': record.get('SOURCE_TABLE', 'Unknown'),
+                'SOURCE_DATABASE': record.get('SOURCE_DATABASE', 'Unknown'),
+                'SOURCE_SCHEMA': record.get('SOURCE_SCHEMA', 'Unknown'),
+                'SOURCE_COLUMNS': ', '.join(record.get('SOURCE_COLUMNS', [])) if isinstance(record.get('SOURCE_COLUMNS'), list) else record.get('SOURCE_COLUMNS', 'Unknown'),
+                'REASONING': record.get('REASONING', 'Unknown')
+            })
+
+        # Swap the old rows for the new ones atomically and mark the model done
         try:
-            insert_df.write.mode('append').save_as_table(COLUMN_LINEAGE_CORTEX)
-            logging.info(f"Inserted/Updated record for FINAL_COLUMN: {insert_data['FINAL_COLUMN']}")
+            swap_model_lineage(session, composite_key, insert_rows)
+            logging.info(f"Replaced lineage for {composite_key} with {len(insert_rows)} record(s).")
         except Exception as e:
-            logging.error(f"Error inserting record into {COLUMN_LINEAGE_CORTEX}: {e}")
-            logging.error(f"Record data: {json.dumps(insert_data)}")
-            continue  # Skip to the next record
+            logging.error(f"Error writing lineage for {composite_key} into {COLUMN_LINEAGE_CORTEX}: {e}")
+            set_model_state(session, composite_key, 'failed', str(e))
+
+    log_tier_summary(tier_stats)
+
+    logging.info("Processing completed.")
+
+def main():
+    # Configure logging for better debugging and visibility
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    # Get the active Snowpark session (in a Snowflake notebook, the session is usually already available)
+    session = Session.builder.getOrCreate()
+    generate_cortex_lineage(session)
 
-logging.info("Processing completed.")
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,14 @@
+import argparse
+import hashlib
 import json
 import math
+import os
+from collections import deque
+
+from combined_lineage_db_tableau import get_column_db_lineage, db_lineage_key
+
+# Directory localView.html looks in for sharded output
+DEFAULT_SHARD_DIR = 'transformed_lineage_shards'
 
 # Load combined_lineage data
 def load_data(file_path):
@@ -56,9 +65,10 @@ def process_database_lineage(lineage, parent_id, node_list):
 
 
 # Recursively process upstream fields
-def handle_upstream_fields(fields, parent_id, node_list):
+def handle_upstream_fields(fields, parent_id, node_list, db_lineage_table, resolved):
     """
     Processes upstreamFields recursively, handles upstreamColumns and upstreamTables.
+    DB lineage may be embedded in a column or referenced into db_lineage_table.
     """
     for field in fields:
         formula = clean_value(field.get('formula', None))  # Capture formula if available
@@ -78,16 +88,19 @@ def handle_upstream_fields(fields, parent_id, node_list):
             )
             
             # If there is database lineage, process it recursively
-            if 'database_lineage' in column:
-                process_database_lineage(column['database_lineage'], column_id, node_list)
+            database_lineage = get_column_db_lineage(column, db_lineage_table, resolved)
+            if database_lineage:
+                process_database_lineage(database_lineage, column_id, node_list)
         
         # Process nested upstream fields if present
         if 'upstreamFields' in field:
-            handle_upstream_fields(field['upstreamFields'], field_id, node_list)
+            handle_upstream_fields(field['upstreamFields'], field_id, node_list, db_lineage_table, resolved)
 
 # Generate nodes for all workbooks, dashboards, etc.
-def generate_nodes(workbooks):
+def generate_nodes(workbooks, db_lineage_table=None):
     node_list = []
+    db_lineage_table = db_lineage_table or {}
+    resolved = {}  # DB lineage references resolved so far
     for workbook in workbooks:
         # Create a node with type "Workbook"
         wb_id = create_node(node_list, workbook['name'], None, node_type="Workbook")
@@ -105,18 +118,312 @@ def generate_nodes(workbooks):
                     sheet_id = create_node(node_list, sheet['name'], ds_id, node_type="Sheet")
                     
                     # Handle upstream fields recursively
-                    handle_upstream_fields(sheet.get('upstreamFields', []), sheet_id, node_list)
+                    handle_upstream_fields(sheet.get('upstreamFields', []), sheet_id, node_list, db_lineage_table, resolved)
     
     return node_list
 
-# Load data from combined_lineage.json
-data = load_data('combined_lineage.json')
+# Add a node to the graph once; later additions of the same key are ignored
+def add_graph_node(graph, key, name, node_type, table=None, formula=None, column_description=None, reasoning=None):
+    if key not in graph['nodes']:
+        graph['nodes'][key] = {
+            'key': key,
+            'name': name,
+            'table': clean_value(table),
+            'type': node_type,
+            'formula': clean_value(formula),
+            'column_description': clean_value(column_description),
+            'reasoning': clean_value(reasoning)
+        }
+    return key
+
+# Add a link from a node to one of its upstream nodes, once
+def add_graph_link(graph, from_key, to_key):
+    if (from_key, to_key) not in graph['link_keys']:
+        graph['link_keys'].add((from_key, to_key))
+        graph['links'].append({'from': from_key, 'to': to_key})
+
+# Add a database lineage node and its upstream models; each node is expanded only once
+def add_database_lineage(graph, lineage, parent_key=None):
+    db_key = add_graph_node(
+        graph,
+        f"Database:{db_lineage_key(lineage)}",
+        lineage['column'],
+        node_type="Database",
+        table=lineage['model'],
+        column_description=lineage.get('column Description', None),
+        reasoning=lineage.get('reasoning', None)
+    )
+    if parent_key is not None:
+        add_graph_link(graph, parent_key, db_key)
+    if db_key in graph['expanded']:
+        return
+    graph['expanded'].add(db_key)
+    for upstream_model in lineage.get('upstream_models', []):
+        add_database_lineage(graph, upstream_model, db_key)
+
+# Add upstream fields, their columns and DB lineage as shared graph nodes
+def add_upstream_fields(graph, fields, parent_key, datasource_name, db_lineage_table, resolved):
+    """
+    Fields are keyed by (datasource, name) and columns by (table, name), so a
+    field used by many sheets, or a column used by many fields, is one node.
+    """
+    for field in fields:
+        field_key = add_graph_node(graph, f"Field:{datasource_name}/{field['name']}", field['name'], node_type="Field",
+                                   formula=field.get('formula', None))
+        add_graph_link(graph, parent_key, field_key)
+
+        for column in field.get('upstreamColumns', []):
+            column_table = clean_value(column.get('upstreamTables', [{}])[0].get('name'))
+            column_type = "Datasource Column" if column_table else "Field"
+            column_key = add_graph_node(graph, f"{column_type}:{column_table or datasource_name}.{column['name']}",
+                                        column['name'], node_type=column_type, table=column_table)
+            add_graph_link(graph, field_key, column_key)
+
+            database_lineage = get_column_db_lineage(column, db_lineage_table, resolved)
+            if database_lineage:
+                add_database_lineage(graph, database_lineage, column_key)
+
+        if 'upstreamFields' in field:
+            add_upstream_fields(graph, field['upstreamFields'], field_key, datasource_name, db_lineage_table, resolved)
+
+# Generate a GoJS GraphLinksModel: unique nodes with stable string keys plus a link array
+def generate_graph(workbooks, db_lineage_table=None):
+    """
+    Unlike generate_nodes, nothing is copied per path: node count follows the
+    real lineage graph. Links point from a node to its upstream nodes, the same
+    direction as parent -> child in the tree output.
+    """
+    graph = {'nodes': {}, 'links': [], 'link_keys': set(), 'expanded': set()}
+    db_lineage_table = db_lineage_table or {}
+    resolved = {}  # DB lineage references resolved so far
+    for workbook in workbooks:
+        wb_key = add_graph_node(graph, f"Workbook:{workbook['name']}", workbook['name'], node_type="Workbook")
+
+        for dashboard in workbook.get('dashboards', []):
+            dashboard_key = add_graph_node(graph, f"Dashboard:{workbook['name']}/{dashboard['name']}",
+                                           dashboard['name'], node_type="Dashboard")
+            add_graph_link(graph, wb_key, dashboard_key)
+
+            for datasource in dashboard.get('upstreamDatasources', []):
+                ds_key = add_graph_node(graph, f"Datasource:{datasource['name']}", datasource['name'], node_type="Datasource")
+                add_graph_link(graph, dashboard_key, ds_key)
+
+                for sheet in datasource.get('sheets', []):
+                    sheet_key = add_graph_node(graph, f"Sheet:{workbook['name']}/{sheet['name']}",
+                                               sheet['name'], node_type="Sheet")
+                    add_graph_link(graph, ds_key, sheet_key)
+
+                    add_upstream_fields(graph, sheet.get('upstreamFields', []), sheet_key, datasource['name'],
+                                        db_lineage_table, resolved)
+
+    return {
+        'class': 'GraphLinksModel',
+        'nodeDataArray': list(graph['nodes'].values()),
+        'linkDataArray': graph['links']
+    }
+
+# Generate a GraphLinksModel from database lineage alone (lineage.json), one root per output column
+def generate_database_graph(db_lineage):
+    graph = {'nodes': {}, 'links': [], 'link_keys': set(), 'expanded': set()}
+    for lineage in db_lineage:
+        add_database_lineage(graph, lineage)
+
+    return {
+        'class': 'GraphLinksModel',
+        'nodeDataArray': list(graph['nodes'].values()),
+        'linkDataArray': graph['links']
+    }
+
+# Layout sizes in pixels, approximating the full diagram's node template (12pt text rows)
+LAYOUT_CHAR_WIDTH = 9
+LAYOUT_NODE_PADDING = 30
+LAYOUT_NODE_HEIGHT = 80
+LAYOUT_SIBLING_SPACING = 20
+LAYOUT_LAYER_SPACING = 50
+
+# Estimate a node's rendered width from the rows the full diagram shows for it
+def estimate_node_width(node):
+    rows = [f"Type: {node.get('type')}"]
+    if node.get('type') in ('Datasource Column', 'Database'):
+        rows += [f"Column: {node.get('name')}", f"Table: {node.get('table') or 'N/A'}"]
+    else:
+        rows.append(f"Name: {node.get('name')}")
+    return max(len(row) for row in rows) * LAYOUT_CHAR_WIDTH + LAYOUT_NODE_PADDING
+
+# Function to lay out a tree top-down (like go.TreeLayout with angle 90) and set 'loc' on every node
+def apply_tree_layout(transformed):
+    """
+    Accepts generate_nodes or generate_graph output. For a graph, each node is
+    placed under the first node that links to it (breadth first from the roots),
+    as TreeLayout does. Siblings are sorted by name and parents are centred
+    over their children. 'loc' is the node's top-left corner as "x y".
+    """
+    if isinstance(transformed, dict):
+        nodes = transformed['nodeDataArray']
+        upstream = {}
+        has_parent = set()
+        for link in transformed['linkDataArray']:
+            upstream.setdefault(link['from'], []).append(link['to'])
+            has_parent.add(link['to'])
+        roots = [node['key'] for node in nodes if node['key'] not in has_parent]
+        # Breadth-first spanning tree; anything only reachable through a cycle becomes a root
+        children = {}
+        placed = set()
+        for start in roots + [node['key'] for node in nodes]:
+            if start in placed:
+                continue
+            if start not in roots:
+                roots.append(start)
+            placed.add(start)
+            queue = deque([start])
+            while queue:
+                key = queue.popleft()
+                for upstream_key in upstream.get(key, []):
+                    if upstream_key not in placed:
+                        placed.add(upstream_key)
+                        children.setdefault(key, []).append(upstream_key)
+                        queue.append(upstream_key)
+    else:
+        nodes = transformed
+        children = {}
+        roots = []
+        for node in nodes:
+            if node.get('parent') in (None, 0):
+                roots.append(node['key'])
+            else:
+                children.setdefault(node['parent'], []).append(node['key'])
+
+    nodes_by_key = {node['key']: node for node in nodes}
+    # Order siblings by name, as the viewer's TreeLayout does with sorting: Ascending
+    for child_keys in children.values():
+        child_keys.sort(key=lambda child: str(nodes_by_key[child].get('name') or ''))
+    own_width = {key: estimate_node_width(node) for key, node in nodes_by_key.items()}
+
+    # Subtree widths, children before parents (iterative post-order)
+    subtree_width = {}
+    order = []
+    stack = list(roots)
+    while stack:
+        key = stack.pop()
+        order.append(key)
+        stack.extend(children.get(key, []))
+    for key in reversed(order):
+        child_keys = children.get(key, [])
+        children_width = sum(subtree_width[child] for child in child_keys) + LAYOUT_SIBLING_SPACING * max(len(child_keys) - 1, 0)
+        subtree_width[key] = max(own_width[key], children_width)
+
+    # Positions, parents before children
+    stack = []
+    left = 0
+    for root in roots:
+        stack.append((root, left, 0))
+        left += subtree_width[root] + LAYOUT_SIBLING_SPACING
+    while stack:
+        key, left, depth = stack.pop()
+        width = subtree_width[key]
+        x = left + (width - own_width[key]) / 2
+        y = depth * (LAYOUT_NODE_HEIGHT + LAYOUT_LAYER_SPACING)
+        nodes_by_key[key]['loc'] = f"{x:g} {y:g}"
+
+        child_keys = children.get(key, [])
+        children_width = sum(subtree_width[child] for child in child_keys) + LAYOUT_SIBLING_SPACING * max(len(child_keys) - 1, 0)
+        child_left = left + (width - children_width) / 2
+        for child in child_keys:
+            stack.append((child, child_left, depth + 1))
+            child_left += subtree_width[child] + LAYOUT_SIBLING_SPACING
+    return transformed
+
+# Function to write one transformed lineage file per (workbook, dashboard) plus an index
+def write_transformed_shards(workbooks, db_lineage_table, shard_dir, model="tree", layout=False):
+    """
+    Each shard holds what transformed_lineage.json would hold for just that
+    dashboard (a TreeModel node array or a GraphLinksModel), so the viewer can
+    load index.json first and fetch a shard only when it is opened.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    index_path = os.path.join(shard_dir, 'index.json')
+    previous_files = set()
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            previous_files = {entry['file'] for entry in json.load(f).get('shards', [])}
+
+    generate = generate_graph if model == "graph" else generate_nodes
+    index = []
+    seen_names = {}  # workbook/dashboard name -> times seen so far
+    for workbook in workbooks:
+        for dashboard in workbook.get('dashboards', []):
+            # Workbook names are only unique within a project; number repeats so no shard overwrites another
+            shard_name = f"{workbook['name']}/{dashboard['name']}"
+            occurrence = seen_names.get(shard_name, 0) + 1
+            seen_names[shard_name] = occurrence
+            if occurrence > 1:
+                print(f"Warning: duplicate workbook/dashboard name {shard_name!r}; writing it as copy {occurrence}.")
+                shard_name += f"#{occurrence}"
+            shard_id = hashlib.sha1(shard_name.encode('utf-8')).hexdigest()[:16]
+            shard = generate([dict(workbook, dashboards=[dashboard])], db_lineage_table)
+            if layout:
+                apply_tree_layout(shard)
+            shard_file = f"{shard_id}.json"
+            with open(os.path.join(shard_dir, shard_file), 'w') as f:
+                json.dump(shard, f, indent=2)
+            index.append({
+                'id': shard_id,
+                'workbook': workbook['name'],
+                'dashboard': dashboard['name'],
+                'file': shard_file,
+                'nodes': len(shard['nodeDataArray']) if model == "graph" else len(shard)
+            })
+
+    # Drop shards of dashboards that no longer exist; only files the previous index listed are touched
+    current_files = {entry['file'] for entry in index}
+    for stale_file in previous_files - current_files:
+        stale_path = os.path.join(shard_dir, os.path.basename(stale_file))
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    with open(index_path, 'w') as f:
+        json.dump({'model': model, 'shards': index}, f, indent=2)
+    return index
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transform combined_lineage.json for the GoJS viewer.")
+    parser.add_argument(
+        "--model", choices=["tree", "graph"], default="tree",
+        help="tree: a TreeModel node per lineage path; graph: a GraphLinksModel with one node per distinct object"
+    )
+    parser.add_argument(
+        "--shard-dir", metavar="DIR", nargs="?", const=DEFAULT_SHARD_DIR,
+        help="write DIR/index.json plus one file per workbook dashboard instead of transformed_lineage.json "
+             f"(DIR defaults to {DEFAULT_SHARD_DIR}, where localView.html looks first)"
+    )
+    parser.add_argument(
+        "--layout", action="store_true",
+        help="compute a top-down tree layout and store each node's 'loc', so the viewer can skip layout"
+    )
+    args = parser.parse_args(argv)
+
+    # Load data from combined_lineage.json
+    data = load_data('combined_lineage.json')
+
+    if args.shard_dir:
+        index = write_transformed_shards(data['workbooks'], data.get('database_lineage'), args.shard_dir,
+                                         args.model, args.layout)
+        print(f"Wrote {len(index)} transformed lineage shards to {args.shard_dir}.")
+        return
+
+    # Generate nodes (or the node and link arrays)
+    if args.model == "graph":
+        nodes = generate_graph(data['workbooks'], data.get('database_lineage'))
+    else:
+        nodes = generate_nodes(data['workbooks'], data.get('database_lineage'))
+    if args.layout:
+        apply_tree_layout(nodes)
 
-# Generate nodes
-nodes = generate_nodes(data['workbooks'])
+    # Output the nodes to a file for GoJS visualization
+    with open('transformed_lineage.json', 'w') as f:
+        json.dump(nodes, f, indent=2)
 
-# Output the nodes to a file for GoJS visualization
-with open('transformed_lineage.json', 'w') as f:
-    json.dump(nodes, f, indent=2)
+    print("Transformed lineage file generated successfully.")
 
-print("Transformed lineage file generated successfully.")
+if __name__ == "__main__":
+    main()
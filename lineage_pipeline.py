@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+
+from dotenv import load_dotenv
+
+from combined_lineage_db_tableau import merge_lineage, convert_to_db_lineage_references
+from gojs_transformed_lineage import generate_nodes, generate_graph
+
+load_dotenv()
+
+# Function to write an in-memory stage result to disk
+def write_json(data, file_path, indent=4):
+    with open(file_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+    print(f"Wrote {file_path}")
+
+# Function to load a stage result from disk instead of recomputing it
+def read_json(file_path):
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+# Stage: manifest/catalog -> TABLE_SCHEMA_REF -> EXPANDED_SQL -> COLUMN_LINEAGE_CORTEX
+def refresh_dbt_lineage():
+    """
+    Runs the Snowflake-side stages. These write to Snowflake tables rather than
+    JSON files, so there is nothing to hand over in memory.
+    """
+    import create_manifest_catalog_ref
+    import expand_sql_ref
+    import gen_upstream_lineage
+    from snowflake.snowpark.session import Session
+
+    create_manifest_catalog_ref.main()
+    expand_sql_ref.main()
+
+    session = Session.builder.configs({
+        'user': os.getenv('user'),
+        'password': os.getenv('password'),
+        'account': os.getenv('account'),
+        'warehouse': os.getenv('warehouse'),
+        'database': os.getenv('database'),
+        'schema': os.getenv('schema'),
+        'role': os.getenv('role')
+    }).create()
+    try:
+        gen_upstream_lineage.generate_cortex_lineage(session)
+    finally:
+        session.close()
+
+# Stage: COLUMN_LINEAGE_CORTEX -> lineage.json structure
+def extract_db_lineage():
+    import gen_full_lineage_db_json
+
+    df = gen_full_lineage_db_json.read_data_from_snowflake()
+    return gen_full_lineage_db_json.build_full_hierarchy(df)
+
+# Stage: Tableau Metadata API -> tableau_lineage.json structure
+def extract_tableau_lineage():
+    import process_tableau_metadata
+
+    return process_tableau_metadata.extract_tableau_lineage()
+
+# Function to run the whole chain in one process, passing objects between stages
+def run_pipeline(tableau_data=None, db_lineage_data=None, refresh_dbt=False,
+                 db_lineage_mode="embed", write_intermediate=False, transformed_model="tree"):
+    """
+    Any stage input passed in (e.g. from a long-lived service's own cache) is used
+    as-is instead of being extracted. Returns a dict with every stage's result.
+    """
+    if refresh_dbt:
+        refresh_dbt_lineage()
+
+    if db_lineage_data is None:
+        db_lineage_data = extract_db_lineage()
+        if write_intermediate:
+            write_json(db_lineage_data, 'lineage.json')
+
+    if tableau_data is None:
+        tableau_data = extract_tableau_lineage()
+        if write_intermediate:
+            write_json(tableau_data, 'tableau_lineage.json')
+
+    combined_lineage = merge_lineage(tableau_data, db_lineage_data)
+    if db_lineage_mode == "reference":
+        combined_lineage = convert_to_db_lineage_references(combined_lineage)
+
+    if transformed_model == "graph":
+        nodes = generate_graph(combined_lineage['workbooks'], combined_lineage.get('database_lineage'))
+    else:
+        nodes = generate_nodes(combined_lineage['workbooks'], combined_lineage.get('database_lineage'))
+
+    return {
+        'db_lineage': db_lineage_data,
+        'tableau_lineage': tableau_data,
+        'combined_lineage': combined_lineage,
+        'transformed_lineage': nodes
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the full lineage pipeline in one process.")
+    parser.add_argument("--refresh-dbt", action="store_true",
+                        help="rebuild TABLE_SCHEMA_REF, EXPANDED_SQL and the Cortex lineage first")
+    parser.add_argument("--tableau-from-file", metavar="PATH",
+                        help="read Tableau lineage from this file instead of the Metadata API")
+    parser.add_argument("--db-from-file", metavar="PATH",
+                        help="read database lineage from this file instead of Snowflake")
+    parser.add_argument("--db-lineage-mode", choices=["embed", "reference"], default="embed",
+                        help="how DB lineage is attached in combined_lineage.json")
+    parser.add_argument("--transformed-model", choices=["tree", "graph"], default="tree",
+                        help="GoJS model written to transformed_lineage.json")
+    parser.add_argument("--write-intermediate", action="store_true",
+                        help="also write lineage.json and tableau_lineage.json")
+    args = parser.parse_args()
+
+    results = run_pipeline(
+        tableau_data=read_json(args.tableau_from_file) if args.tableau_from_file else None,
+        db_lineage_data=read_json(args.db_from_file) if args.db_from_file else None,
+        refresh_dbt=args.refresh_dbt,
+        db_lineage_mode=args.db_lineage_mode,
+        write_intermediate=args.write_intermediate,
+        transformed_model=args.transformed_model
+    )
+
+    # combined_lineage.json feeds app.py and transformed_lineage.json feeds localView.html
+    write_json(results['combined_lineage'], 'combined_lineage.json')
+    write_json(results['transformed_lineage'], 'transformed_lineage.json', indent=2)
+
+if __name__ == "__main__":
+    main()
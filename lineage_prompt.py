@@ -0,0 +1,297 @@
+import math
+import re
+
+# Base instructions sent with every lineage prompt
+LINEAGE_INSTRUCTIONS = (
+    "You are an expert in SQL lineage analysis. "
+    "Given the following SQL query, identify the source tables and columns for each final column in the SELECT statement. "
+    "Additionally, provide simple reasoning in business-friendly language explaining the transformation for each column. "
+    "Provide the results as a JSON array of objects, where each object has the keys: FINAL_COLUMN, SOURCE_TABLE, SOURCE_DATABASE, SOURCE_SCHEMA, SOURCE_COLUMNS, and REASONING. "
+)
+
+# Extra instructions for a per-CTE sub-prompt, where sources may be other CTEs
+CTE_INSTRUCTIONS = (
+    "The query defines the intermediate result {cte_name}. "
+    "When a column comes from one of the intermediate results {cte_names}, use that name as SOURCE_TABLE and leave SOURCE_DATABASE and SOURCE_SCHEMA empty. "
+)
+
+# Instructions for a follow-up prompt covering only missing or invalid columns
+FOLLOWUP_INSTRUCTIONS = (
+    "Return ONLY a JSON array with one object for each of these final columns of the SQL query below: {columns}. "
+    "Each object has the keys FINAL_COLUMN, SOURCE_TABLE, SOURCE_DATABASE, SOURCE_SCHEMA, SOURCE_COLUMNS and REASONING "
+    "(one short business-friendly sentence). "
+)
+
+# Prompts estimated above this many tokens are split into per-CTE sub-prompts
+MAX_PROMPT_TOKENS = 6000
+
+# Matches string literals, quoted identifiers, line comments and block comments
+_SQL_TOKEN_PATTERN = re.compile(
+    r"('(?:[^']|'')*')"        # string literal
+    r'|("(?:[^"]|"")*")'       # quoted identifier
+    r"|(--[^\n]*)"             # line comment
+    r"|(/\*.*?\*/)"            # block comment
+    r"|(\s+)",                 # whitespace run
+    re.DOTALL
+)
+
+# Function to roughly estimate the token count of a prompt
+def estimate_tokens(text):
+    """
+    Cheap local estimate (about four characters per token), good enough to
+    compare prompt sizes and decide when to chunk.
+    """
+    return math.ceil(len(text) / 4)
+
+# Function to strip comments and collapse whitespace outside of quoted text
+def minify_sql(sql):
+    def replacer(match):
+        literal, identifier, line_comment, block_comment, whitespace = match.groups()
+        if literal or identifier:
+            return match.group(0)
+        return ' '
+
+    minified = _SQL_TOKEN_PATTERN.sub(replacer, sql)
+    # Comments next to whitespace leave runs of spaces behind; collapse them the same way
+    return _SQL_TOKEN_PATTERN.sub(replacer, minified).strip()
+
+# Function to find the index of the parenthesis closing the one at start
+def _find_closing_paren(sql, start):
+    depth = 0
+    index = start
+    while index < len(sql):
+        char = sql[index]
+        if char in ("'", '"'):
+            end = sql.find(char, index + 1)
+            if end == -1:
+                raise ValueError("Unterminated quoted string in SQL")
+            index = end + 1
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return index
+        index += 1
+    raise ValueError("Unbalanced parentheses in SQL")
+
+# Function to split a minified query into its CTEs and final SELECT
+def split_ctes(sql):
+    """
+    Returns (ctes, final_select) where ctes is an ordered list of (name, body).
+    Queries without a leading WITH clause return ([], sql).
+    """
+    with_match = re.match(r"\s*WITH\s+", sql, re.IGNORECASE)
+    if not with_match:
+        return [], sql
+
+    ctes = []
+    position = with_match.end()
+    while True:
+        cte_match = re.compile(r"([\w\"]+)\s+AS\s*\(", re.IGNORECASE).match(sql, position)
+        if not cte_match:
+            raise ValueError(f"Could not parse CTE at position {position}")
+        open_paren = cte_match.end() - 1
+        close_paren = _find_closing_paren(sql, open_paren)
+        ctes.append((cte_match.group(1).strip('"').upper(), sql[open_paren + 1:close_paren].strip()))
+        position = close_paren + 1
+        comma_match = re.compile(r"\s*,\s*").match(sql, position)
+        if not comma_match:
+            break
+        position = comma_match.end()
+
+    return ctes, sql[position:].strip()
+
+# Function to list the output column names of a SELECT statement
+def projected_columns(select_sql):
+    """
+    Best-effort parse of the top-level projection list. Returns an empty set
+    when the list cannot be determined (e.g. SELECT * or an unterminated quote).
+    """
+    select_match = re.match(r"\s*SELECT\s+(?:DISTINCT\s+)?", select_sql, re.IGNORECASE)
+    if not select_match:
+        return set()
+
+    # Collect top-level projections up to the FROM keyword
+    projections = []
+    depth = 0
+    current = ''
+    index = select_match.end()
+    while index < len(select_sql):
+        char = select_sql[index]
+        if char in ("'", '"'):
+            end = select_sql.find(char, index + 1) + 1
+            if end == 0:
+                return set()
+            current += select_sql[index:end]
+            index = end
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if depth == 0 and re.match(r"\s+FROM\b", select_sql[index:], re.IGNORECASE):
+            break
+        if depth == 0 and char == ',':
+            projections.append(current)
+            current = ''
+        else:
+            current += char
+        index += 1
+    projections.append(current)
+
+    columns = set()
+    for projection in projections:
+        projection = projection.strip()
+        alias_match = re.search(r"\s+AS\s+([\w\"]+)$", projection, re.IGNORECASE)
+        if alias_match:
+            columns.add(alias_match.group(1).strip('"').upper())
+        elif re.fullmatch(r"[\w\".]+", projection) and not projection.endswith('*'):
+            columns.add(projection.split('.')[-1].strip('"').upper())
+        else:
+            return set()
+    return columns
+
+# Function to build the prompts for one model, chunking by CTE if needed
+def build_lineage_prompts(sql_query, max_tokens=MAX_PROMPT_TOKENS):
+    """
+    Returns (prompts, stats). prompts is a list of dicts with keys:
+      cte_name  - None for a whole-query prompt or the final SELECT chunk
+      prompt    - the prompt text
+      columns   - set of columns the chunk projects (may be empty if unknown)
+      sql       - the compacted SQL the prompt covers
+      context   - chunk-specific instructions, reused by follow-up prompts
+    stats reports token estimates before and after compaction; when the query
+    is chunked, chunked_tokens is the total across the chunk prompts, each of
+    which repeats the instructions.
+    """
+    raw_prompt = LINEAGE_INSTRUCTIONS + "SQL Query: " + sql_query
+    compact_sql = minify_sql(sql_query)
+    compact_prompt = LINEAGE_INSTRUCTIONS + "SQL Query: " + compact_sql
+
+    stats = {
+        'raw_tokens': estimate_tokens(raw_prompt),
+        'compact_tokens': estimate_tokens(compact_prompt),
+        'chunked_tokens': None,
+        'chunks': 1
+    }
+
+    try:
+        ctes, final_select = split_ctes(compact_sql)
+    except ValueError:
+        # Unusual syntax; fall back to a single compacted prompt
+        ctes, final_select = [], compact_sql
+    if stats['compact_tokens'] <= max_tokens or not ctes:
+        return [{
+            'cte_name': None,
+            'prompt': compact_prompt,
+            'columns': projected_columns(final_select),
+            'sql': compact_sql,
+            'context': ''
+        }], stats
+
+    cte_names = [name for name, _ in ctes]
+    prompts = []
+    for cte_name, body in ctes + [(None, final_select)]:
+        context = CTE_INSTRUCTIONS.format(cte_name=cte_name or 'FINAL', cte_names=', '.join(cte_names))
+        prompts.append({
+            'cte_name': cte_name,
+            'prompt': LINEAGE_INSTRUCTIONS + context + "SQL Query: " + body,
+            'columns': projected_columns(body),
+            'sql': body,
+            'context': context
+        })
+
+    stats['chunks'] = len(prompts)
+    stats['chunked_tokens'] = sum(estimate_tokens(chunk['prompt']) for chunk in prompts)
+    return prompts, stats
+
+# Function to build a compact follow-up prompt for missing or invalid columns
+def build_followup_prompt(chunk, missing_columns):
+    return (
+        FOLLOWUP_INSTRUCTIONS.format(columns=', '.join(sorted(missing_columns)))
+        + chunk['context']
+        + "SQL Query: " + chunk['sql']
+    )
+
+# Function to pair each source column of a record with its source table
+def _source_pairs(record):
+    """
+    Returns [(TABLE, COLUMN), ...]. SOURCE_COLUMNS may be a list or a comma
+    separated string, and entries may be qualified (TABLE.COLUMN).
+    """
+    tables = [table.strip().upper() for table in str(record.get('SOURCE_TABLE') or '').split(',') if table.strip()]
+    source_columns = record.get('SOURCE_COLUMNS') or []
+    if isinstance(source_columns, str):
+        source_columns = source_columns.split(',')
+    source_columns = [str(column).strip().upper() for column in source_columns if str(column).strip()]
+
+    pairs = []
+    for index, column in enumerate(source_columns):
+        parts = column.split('.')
+        if len(parts) > 1:
+            table = parts[-2]
+        elif len(tables) == len(source_columns):
+            table = tables[index]
+        else:
+            table = tables[0] if tables else ''
+        pairs.append((table, parts[-1]))
+    return pairs
+
+# Function to resolve per-CTE partial lineages into final-column lineage
+def stitch_partial_lineages(partial_lineages):
+    """
+    partial_lineages maps a CTE name (None for the final SELECT) to the records
+    returned for that chunk. Sources pointing at a CTE are followed until they
+    reach a physical table, so the result looks like a whole-query answer.
+    SOURCE_TABLE and SOURCE_COLUMNS are emitted pairwise aligned.
+    """
+    cte_records = {}
+    table_locations = {}
+    for cte_name, records in partial_lineages.items():
+        if cte_name is not None:
+            cte_records[cte_name] = {str(record.get('FINAL_COLUMN', '')).strip().upper(): record for record in records}
+    for records in partial_lineages.values():
+        for record in records:
+            for table, _ in _source_pairs(record):
+                if table not in cte_records and table not in table_locations:
+                    table_locations[table] = (record.get('SOURCE_DATABASE', ''), record.get('SOURCE_SCHEMA', ''))
+
+    def resolve(table, column, seen):
+        """Returns (physical (table, column) pairs, records passed through)."""
+        record = cte_records.get(table, {}).get(column)
+        if record is None or (table, column) in seen:
+            return [(table, column)], []
+        sources, chain = [], [record]
+        for source_table, source_column in _source_pairs(record):
+            upstream_sources, upstream_chain = resolve(source_table, source_column, seen | {(table, column)})
+            sources.extend(upstream_sources)
+            chain.extend(upstream_chain)
+        return sources or [(table, column)], chain
+
+    stitched = []
+    for record in partial_lineages.get(None, []):
+        sources, chain = [], [record]
+        for source_table, source_column in _source_pairs(record):
+            upstream_sources, upstream_chain = resolve(source_table, source_column, frozenset())
+            sources.extend(upstream_sources)
+            chain.extend(upstream_chain)
+
+        # Keep the first occurrence of each source and each reasoning sentence
+        sources = list(dict.fromkeys(sources))
+        reasoning = list(dict.fromkeys(str(r.get('REASONING') or '') for r in chain))
+        database, schema = next(
+            (table_locations[table] for table, _ in sources if table in table_locations),
+            (record.get('SOURCE_DATABASE', ''), record.get('SOURCE_SCHEMA', ''))
+        )
+
+        stitched.append({
+            'FINAL_COLUMN': record.get('FINAL_COLUMN'),
+            'SOURCE_TABLE': ', '.join(table for table, _ in sources),
+            'SOURCE_DATABASE': database,
+            'SOURCE_SCHEMA': schema,
+            'SOURCE_COLUMNS': [column for _, column in sources],
+            'REASONING': ' '.join(r for r in reasoning if r)
+        })
+    return stitched
@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import re
+from collections import deque
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from gojs_transformed_lineage import DEFAULT_SHARD_DIR, generate_database_graph, generate_graph
+
+# Default search result limit
+DEFAULT_SEARCH_LIMIT = 50
+
+# Static files the viewer needs; nothing else in the directory is served
+STATIC_FILES = {"/localView.html", "/transformed_lineage.json"}
+SHARD_FILE_PATTERN = re.compile(rf"/{re.escape(DEFAULT_SHARD_DIR)}/[\w-]+\.json")
+
+# Define the LineageGraph class: the lineage as shared nodes with upstream and downstream adjacency
+class LineageGraph:
+    def __init__(self, model):
+        """
+        model is a GraphLinksModel dict as written by generate_graph. Links point
+        from a node to its upstream nodes, so upstream follows 'from' -> 'to'
+        and downstream follows 'to' -> 'from'.
+        """
+        self.nodes = {node['key']: node for node in model['nodeDataArray']}
+        self.upstream = {key: [] for key in self.nodes}
+        self.downstream = {key: [] for key in self.nodes}
+        for link in model['linkDataArray']:
+            self.upstream[link['from']].append(link['to'])
+            self.downstream[link['to']].append(link['from'])
+
+    @classmethod
+    def from_file(cls, path):
+        """Builds the graph from combined_lineage.json or the database-only lineage.json."""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            return cls(generate_database_graph(data))
+        return cls(generate_graph(data['workbooks'], data.get('database_lineage')))
+
+    def roots(self):
+        """Keys of the nodes nothing links to: workbooks, or the top database models."""
+        return [key for key, downstream in self.downstream.items() if not downstream]
+
+    def node(self, key):
+        node = self.nodes.get(key)
+        if node is None:
+            return None
+        return dict(node, upstream=self.upstream[key], downstream=self.downstream[key])
+
+    def walk(self, keys, levels=None, direction="upstream"):
+        """
+        Breadth-first from keys. levels counts the start nodes as level 1, as
+        findTreeParts does in the viewer; None walks to the end of the lineage.
+        """
+        adjacency = []
+        if direction in ("upstream", "both"):
+            adjacency.append(self.upstream)
+        if direction in ("downstream", "both"):
+            adjacency.append(self.downstream)
+
+        found = {key: 1 for key in keys if key in self.nodes}
+        queue = deque(found)
+        while queue:
+            key = queue.popleft()
+            if levels is not None and found[key] >= levels:
+                continue
+            for neighbours in adjacency:
+                for neighbour in neighbours[key]:
+                    if neighbour not in found:
+                        found[neighbour] = found[key] + 1
+                        queue.append(neighbour)
+        return found
+
+    def subgraph(self, keys):
+        """Returns a GraphLinksModel dict with these nodes and the links between them."""
+        keys = set(keys)
+        return {
+            'class': 'GraphLinksModel',
+            'nodeDataArray': [self.nodes[key] for key in self.nodes if key in keys],
+            'linkDataArray': [{'from': key, 'to': upstream} for key in self.nodes if key in keys
+                              for upstream in self.upstream[key] if upstream in keys]
+        }
+
+    def search(self, text, node_type=None, limit=DEFAULT_SEARCH_LIMIT):
+        """Nodes whose name or table contains text (case-insensitive), optionally of one type."""
+        text = text.lower()
+        matches = []
+        for node in self.nodes.values():
+            if node_type and node['type'] != node_type:
+                continue
+            if text in (node['name'] or '').lower() or text in (node['table'] or '').lower():
+                matches.append(node)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+# Define the LineageRequestHandler class: JSON endpoints under /api plus the viewer's static files
+class LineageRequestHandler(SimpleHTTPRequestHandler):
+    def is_static_path(self, path):
+        return path in STATIC_FILES or SHARD_FILE_PATTERN.fullmatch(path) is not None
+
+    def send_static(self, path):
+        """
+        Returns True when path is a whitelisted viewer file for the base class
+        to serve; scripts, credentials and caches beside them are never served.
+        """
+        if path == "/":
+            self.send_response(302)
+            self.send_header("Location", "/localView.html")
+            self.end_headers()
+            return False
+        if not self.is_static_path(path):
+            self.send_error(404, f"Unknown path {path}")
+            return False
+        return True
+
+    def do_HEAD(self):
+        if self.send_static(urlparse(self.path).path):
+            super().do_HEAD()
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not url.path.startswith("/api/"):
+            if self.send_static(url.path):
+                super().do_GET()
+            return
+
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        graph = self.server.graph
+        try:
+            levels = int(params["levels"]) if "levels" in params else None
+            limit = int(params.get("limit", DEFAULT_SEARCH_LIMIT))
+        except ValueError:
+            return self.send_json(400, {"error": "levels and limit must be integers"})
+
+        if url.path == "/api/roots":
+            # The roots plus their first levels, enough for an initial full diagram
+            self.send_json(200, graph.subgraph(graph.walk(graph.roots(), levels or 1)))
+        elif url.path == "/api/search":
+            self.send_json(200, {"nodes": graph.search(params.get("q", ""), params.get("type"), limit)})
+        elif url.path in ("/api/node", "/api/neighborhood", "/api/upstream", "/api/downstream"):
+            key = params.get("key")
+            if key not in graph.nodes:
+                return self.send_json(404, {"error": f"Unknown node key {key!r}"})
+            if url.path == "/api/node":
+                self.send_json(200, graph.node(key))
+            elif url.path == "/api/neighborhood":
+                direction = params.get("direction", "upstream")
+                if direction not in ("upstream", "downstream", "both"):
+                    return self.send_json(400, {"error": "direction must be upstream, downstream or both"})
+                self.send_json(200, graph.subgraph(graph.walk([key], levels or 3, direction)))
+            else:
+                self.send_json(200, graph.subgraph(graph.walk([key], levels, url.path[len("/api/"):])))
+        else:
+            self.send_json(404, {"error": f"Unknown path {url.path}"})
+
+# Define the LineageQueryServer class: a threaded HTTP server holding one LineageGraph in memory
+class LineageQueryServer(ThreadingHTTPServer):
+    def __init__(self, address, graph, directory):
+        self.graph = graph
+        super().__init__(address, partial(LineageRequestHandler, directory=directory))
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve localView.html and its lineage files plus a JSON query API over the lineage, held in memory.")
+    parser.add_argument("--lineage", default="combined_lineage.json",
+                        help="combined_lineage.json, or the database-only lineage.json")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    graph = LineageGraph.from_file(args.lineage)
+    server = LineageQueryServer((args.host, args.port), graph, os.path.dirname(os.path.abspath(__file__)))
+    print(f"Loaded {len(graph.nodes)} nodes from {args.lineage}")
+    print(f"Open {server.url}/localView.html")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
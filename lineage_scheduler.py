@@ -0,0 +1,283 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Input/output hashes recorded by the last successful run of each stage
+STATE_FILE = '.lineage_state.json'
+
+# Snowflake tables used by the dbt branch
+TABLE_SCHEMA_REF = 'TABLE_SCHEMA_REF'
+COLUMN_LINEAGE_CORTEX = 'COLUMN_LINEAGE_CORTEX'
+
+# Define the Stage class: a unit of work with the artifacts it reads and writes
+class Stage:
+    def __init__(self, name, inputs, outputs, run, external=False):
+        """
+        inputs/outputs are artifact ids: 'file:<path>' or 'table:<name>[<col>,...]'.
+        external stages read from outside systems (e.g. the Tableau Metadata API)
+        that cannot be hashed, so they always run unless external stages are skipped.
+        """
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.run = run
+        self.external = external
+
+# Stage runners. Imports are local so that running only the file-based stages
+# does not require the Snowflake or Tableau client libraries.
+def run_table_schema_ref():
+    import create_manifest_catalog_ref
+    create_manifest_catalog_ref.main()
+
+def run_expand_sql():
+    import expand_sql_ref
+    expand_sql_ref.main()
+
+def run_cortex_lineage():
+    import gen_upstream_lineage
+    from snowflake.snowpark.session import Session
+
+    session = Session.builder.configs(snowflake_connection_parameters()).create()
+    try:
+        gen_upstream_lineage.generate_cortex_lineage(session)
+    finally:
+        session.close()
+
+def run_db_lineage():
+    import gen_full_lineage_db_json
+    gen_full_lineage_db_json.main()
+
+def run_tableau_lineage():
+    import process_tableau_metadata
+    process_tableau_metadata.main([])
+
+def run_combined_lineage():
+    import combined_lineage_db_tableau
+    combined_lineage_db_tableau.main([])
+
+def run_transformed_lineage():
+    import gojs_transformed_lineage
+    gojs_transformed_lineage.main([])
+
+# The stage graph. Order matters only for display; dependencies come from artifacts.
+STAGES = [
+    Stage('table_schema_ref',
+          inputs=['file:manifest.json', 'file:catalog.json'],
+          outputs=[f'table:{TABLE_SCHEMA_REF}[UNIQUE_KEY,SQL,REFERENCE]'],
+          run=run_table_schema_ref),
+    Stage('expand_sql',
+          inputs=[f'table:{TABLE_SCHEMA_REF}[UNIQUE_KEY,SQL,REFERENCE]'],
+          outputs=[f'table:{TABLE_SCHEMA_REF}[UNIQUE_KEY,EXPANDED_SQL]'],
+          run=run_expand_sql),
+    Stage('cortex_lineage',
+          inputs=[f'table:{TABLE_SCHEMA_REF}[UNIQUE_KEY,EXPANDED_SQL]'],
+          outputs=[f'table:{COLUMN_LINEAGE_CORTEX}[*]'],
+          run=run_cortex_lineage),
+    Stage('db_lineage',
+          inputs=[f'table:{COLUMN_LINEAGE_CORTEX}[*]'],
+          outputs=['file:lineage.json'],
+          run=run_db_lineage),
+    Stage('tableau_lineage',
+          inputs=[],
+          outputs=['file:tableau_lineage.json'],
+          run=run_tableau_lineage,
+          external=True),
+    Stage('combined_lineage',
+          inputs=['file:lineage.json', 'file:tableau_lineage.json'],
+          outputs=['file:combined_lineage.json'],
+          run=run_combined_lineage),
+    Stage('transformed_lineage',
+          inputs=['file:combined_lineage.json'],
+          outputs=['file:transformed_lineage.json'],
+          run=run_transformed_lineage),
+]
+
+def snowflake_connection_parameters():
+    return {
+        'user': os.getenv('user'),
+        'password': os.getenv('password'),
+        'account': os.getenv('account'),
+        'warehouse': os.getenv('warehouse'),
+        'database': os.getenv('database'),
+        'schema': os.getenv('schema'),
+        'role': os.getenv('role')
+    }
+
+# Define the Fingerprinter class: content hashes for files and Snowflake tables
+class Fingerprinter:
+    def __init__(self):
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            import snowflake.connector
+            self._conn = snowflake.connector.connect(**snowflake_connection_parameters())
+        return self._conn
+
+    def fingerprint(self, artifact):
+        """Returns a content hash, or None if the artifact does not exist."""
+        kind, _, name = artifact.partition(':')
+        if kind == 'file':
+            if not os.path.exists(name):
+                return None
+            digest = hashlib.sha256()
+            with open(name, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            return digest.hexdigest()
+        if kind == 'table':
+            table, _, columns = name.partition('[')
+            columns = columns.rstrip(']') or '*'
+            # HASH_AGG is order-independent, so no ORDER BY is needed
+            with self._lock:
+                cursor = self._connection().cursor()
+                try:
+                    cursor.execute(f"SELECT TO_VARCHAR(HASH_AGG({columns})) FROM {table}")
+                    return cursor.fetchone()[0]
+                except Exception as e:
+                    print(f"Could not fingerprint {artifact}: {e}")
+                    return None
+                finally:
+                    cursor.close()
+        raise ValueError(f"Unknown artifact kind in '{artifact}'")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, 'r') as f:
+        return json.load(f)
+
+def save_state(state):
+    with open(STATE_FILE, 'w') as f:
+        json.dump(state, f, indent=4, sort_keys=True)
+
+# Function to decide whether a stage needs to run, returning the reason or None
+def stale_reason(stage, fingerprints, previous, force, skip_external):
+    if stage.name in force:
+        return "forced"
+    if stage.external:
+        return None if skip_external else "reads an external system"
+    if previous is None:
+        return "never run"
+    for artifact, digest in fingerprints['inputs'].items():
+        if digest is None or previous['inputs'].get(artifact) != digest:
+            return f"input changed: {artifact}"
+    for artifact, digest in fingerprints['outputs'].items():
+        if digest is None or previous['outputs'].get(artifact) != digest:
+            return f"output missing or modified: {artifact}"
+    return None
+
+# Function to run the selected stages, in parallel where the graph allows
+def run_stages(stage_names=None, force=(), skip_external=False, workers=4, dry_run=False):
+    """
+    A stage becomes ready once every selected stage producing one of its inputs
+    has finished. Ready stages are hashed and either skipped or run on the pool,
+    so independent branches (Tableau extraction and the dbt chain) overlap.
+    Returns {stage name: 'ran' | 'would run' | 'skipped' | 'failed' | 'blocked'}.
+    """
+    selected = [stage for stage in STAGES if stage_names is None or stage.name in stage_names]
+    producers = {artifact: stage.name for stage in selected for artifact in stage.outputs}
+    depends_on = {
+        stage.name: {producers[artifact] for artifact in stage.inputs
+                     if artifact in producers and producers[artifact] != stage.name}
+        for stage in selected
+    }
+
+    state = load_state()
+    state_lock = threading.Lock()
+    fingerprinter = Fingerprinter()
+    results = {}
+
+    def fingerprint_stage(stage):
+        return {
+            'inputs': {artifact: fingerprinter.fingerprint(artifact) for artifact in stage.inputs},
+            'outputs': {artifact: fingerprinter.fingerprint(artifact) for artifact in stage.outputs}
+        }
+
+    def execute(stage):
+        fingerprints = fingerprint_stage(stage)
+        reason = stale_reason(stage, fingerprints, state.get(stage.name), force, skip_external)
+        if reason is None:
+            print(f"[{stage.name}] up to date, skipping")
+            return 'skipped'
+        print(f"[{stage.name}] running ({reason})")
+        if dry_run:
+            return 'would run'
+        stage.run()
+        # Record what this run consumed and produced
+        recorded = {
+            'inputs': fingerprints['inputs'],
+            'outputs': {artifact: fingerprinter.fingerprint(artifact) for artifact in stage.outputs}
+        }
+        with state_lock:
+            state[stage.name] = recorded
+            save_state(state)
+        print(f"[{stage.name}] done")
+        return 'ran'
+
+    pending = {stage.name: stage for stage in selected}
+    running = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending or running:
+                for name in list(pending):
+                    dependencies = depends_on[name]
+                    if any(results.get(dep) in ('failed', 'blocked') for dep in dependencies):
+                        results[name] = 'blocked'
+                        del pending[name]
+                        print(f"[{name}] blocked by a failed upstream stage")
+                    elif all(dep in results for dep in dependencies):
+                        running[executor.submit(execute, pending.pop(name))] = name
+                if not running:
+                    if pending:
+                        raise RuntimeError(f"Stages can never become ready: {sorted(pending)}")
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        print(f"[{name}] failed: {e}")
+                        results[name] = 'failed'
+    finally:
+        fingerprinter.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally rebuild lineage outputs whose inputs changed.")
+    parser.add_argument("stages", nargs="*", metavar="STAGE",
+                        help=f"stages to consider (default: all): {', '.join(stage.name for stage in STAGES)}")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                        help="run this stage even if its inputs are unchanged (repeatable)")
+    parser.add_argument("--skip-external", action="store_true",
+                        help="do not re-extract from external systems (Tableau)")
+    parser.add_argument("--workers", type=int, default=4, help="maximum stages to run at once")
+    parser.add_argument("--dry-run", action="store_true", help="report what would run without running it")
+    args = parser.parse_args()
+
+    stage_names = {stage.name for stage in STAGES}
+    unknown = (set(args.stages) | set(args.force)) - stage_names
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+
+    results = run_stages(args.stages or None, force=set(args.force), skip_external=args.skip_external,
+                         workers=args.workers, dry_run=args.dry_run)
+    for stage in STAGES:
+        if stage.name in results:
+            print(f"{stage.name:>20}: {results[stage.name]}")
+
+if __name__ == "__main__":
+    main()
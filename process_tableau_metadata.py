@@ -1,101 +1,137 @@
+import argparse
 import json
+import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from tableau_metadata_client import MetadataClient, MetadataApiError, DEFAULT_PAGE_SIZE
+from tableau_metadata_cache import MetadataCache, DEFAULT_CACHE_PATH
 
 # Replace these with your actual Tableau Online details
 instance = "prod-apnortheast-a"
 api_version = "3.14"
-auth_url = f"https://{instance}.online.tableau.com/api/{api_version}/auth/signin"
+
+# Override to point at another server, e.g. a local stand-in for testing
+server_url = os.getenv("TABLEAU_SERVER_URL", f"https://{instance}.online.tableau.com")
+
+# Set to a directory to record every GraphQL request/response as a replay fixture
+record_dir = os.getenv("TABLEAU_RECORD_DIR")
 
 token_name = "demo_lineage"
 token_value = "OduNru8eTcevWyUj75fFHQ==:NwB6cBGwWeOjrhSbVoUkIIFLdxy67ACh"
 site_id = ""
 
-auth_payload = {
-    "credentials": {
-        "personalAccessTokenName": token_name,
-        "personalAccessTokenSecret": token_value,
-        "site": {"contentUrl": site_id}
+# Workbook and dashboard whose lineage is extracted (site-wide mode extracts every one)
+WORKBOOK_NAME = "Jaffle Shop "
+DASHBOARD_NAME = "Dashboard 1"
+
+# Site-wide mode: published datasource ids per idWithin filter, and workbooks queried at once
+DATASOURCE_ID_CHUNK_SIZE = 100
+DEFAULT_CONCURRENCY = 8
+
+# Site-wide mode writes one lineage file per workbook here, plus index.json
+DEFAULT_SHARD_DIR = "tableau_lineage_shards"
+
+# Function to create the shared Metadata API client
+def create_client():
+    return MetadataClient(server_url, api_version, token_name, token_value, site_id, record_dir=record_dir)
+
+# Step 1: Fetch the published datasources (id, name, updatedAt)
+def fetch_published_datasources(client, page_size=DEFAULT_PAGE_SIZE):
+    fetch_datasource_query = """
+    query publishedDatasources($first: Int, $after: String) {
+      publishedDatasourcesConnection(first: $first, after: $after) {
+        nodes {
+          id
+          name
+          updatedAt
+        }
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+      }
     }
-}
-
-auth_headers = {
-    'Content-Type': 'application/json',
-    'Accept': 'application/json'
-}
-
-# Authenticate
-try:
-    response = requests.post(auth_url, json=auth_payload, headers=auth_headers)
-    response.raise_for_status()
-    data = response.json()
-    auth_token = data['credentials']['token']
-    print(f"Authenticated with token: {auth_token}")
-except requests.exceptions.RequestException as e:
-    print(f"Request failed: {e}")
-    exit()
-
-# Define the GraphQL endpoint
-metadata_api_url = f"https://{instance}.online.tableau.com/api/metadata/graphql"
-headers = {
-    "Content-Type": "application/json",
-    "X-Tableau-Auth": auth_token
-}
-
-# Step 1: Fetch the list of IDs for the published datasource
-fetch_datasource_query = """
-{
-  publishedDatasources {
-    id
-    name
-  }
-}
-"""
-
-response = requests.post(metadata_api_url, json={'query': fetch_datasource_query}, headers=headers)
-response.raise_for_status()
-
-# Parse the JSON response to get the datasource IDs
-datasource_data = response.json()
-
-# Extract multiple IDs from the response
-published_datasource_ids = [ds['id'] for ds in datasource_data['data']['publishedDatasources']]
-
-print(f"Published Datasource IDs: {published_datasource_ids}")
-
-# Prepare the list of IDs for the `idWithin` filter
-idWithin_str = '", "'.join(published_datasource_ids)
-idWithin_filter = f'["{idWithin_str}"]'
-
-# Step 2: Construct the main GraphQL query using sheetFieldInstances and upstreamFields
-graphql_query = f"""
-{{
-  workbooks(filter: {{name: "Jaffle Shop "}}) {{
-    name
-    dashboard: dashboards(filter: {{name: "Dashboard 1"}}) {{
-      name
-      id
-      upstreamDatasources(filter: {{idWithin: {idWithin_filter}}}) {{
+    """
+
+    # Page through the datasources
+    published_datasources = []
+    for datasources in client.paginate(fetch_datasource_query, ["publishedDatasourcesConnection"], page_size=page_size):
+        published_datasources.extend(datasources)
+    return published_datasources
+
+def fetch_published_datasource_ids(client, page_size=DEFAULT_PAGE_SIZE, published_datasources=None):
+    if published_datasources is None:
+        published_datasources = fetch_published_datasources(client, page_size)
+
+    # Extract multiple IDs from the datasources
+    published_datasource_ids = [ds['id'] for ds in published_datasources]
+    return published_datasource_ids
+
+# Function to list the workbooks in scope with their last update time
+def fetch_workbook_versions(client, page_size=DEFAULT_PAGE_SIZE, workbook_name=WORKBOOK_NAME):
+    """
+    Lists the workbook named workbook_name, or every workbook on the site if it is None.
+    """
+    workbook_filter = "filter: {name: $workbookName}, " if workbook_name is not None else ""
+    fetch_workbook_query = """
+    query workbookVersions($workbookName: String, $first: Int, $after: String) {
+      workbooksConnection(""" + workbook_filter + """first: $first, after: $after) {
+        nodes {
+          id
+          name
+          updatedAt
+        }
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+      }
+    }
+    """
+    workbook_versions = []
+    for workbooks in client.paginate(fetch_workbook_query, ["workbooksConnection"],
+                                     variables={"workbookName": workbook_name}, page_size=page_size):
+        workbook_versions.extend(workbooks)
+    return workbook_versions
+
+# Step 2: Fetch dashboard lineage using sheetFieldInstances and upstreamFields
+def fetch_dashboard_lineage(client, published_datasource_ids, workbook_ids=None, dashboard_name=DASHBOARD_NAME):
+    """
+    Fetches the lineage of the workbook named WORKBOOK_NAME or, if workbook_ids
+    is given, of just those workbooks. Only the dashboard named dashboard_name
+    is included, or every dashboard if it is None.
+    """
+    # Prepare the list of IDs for the `idWithin` filter
+    idWithin_str = '", "'.join(published_datasource_ids)
+    idWithin_filter = f'["{idWithin_str}"]'
+    if workbook_ids is None:
+        workbook_filter = f'{{name: "{WORKBOOK_NAME}"}}'
+    else:
+        workbook_ids_str = '", "'.join(workbook_ids)
+        workbook_filter = f'{{idWithin: ["{workbook_ids_str}"]}}'
+    if dashboard_name is None:
+        dashboards_field = "dashboards"
+    else:
+        dashboards_field = f'dashboards(filter: {{name: "{dashboard_name}"}})'
+
+    # Construct the main GraphQL query using sheetFieldInstances and upstreamFields
+    graphql_query = f"""
+    query dashboardLineage {{
+      workbooks(filter: {workbook_filter}) {{
+        id
         name
-        downstreamSheets {{
+        dashboard: {dashboards_field} {{
           name
-          worksheetFields {{
+          id
+          upstreamDatasources(filter: {{idWithin: {idWithin_filter}}}) {{
             name
-          }}
-          sheetFieldInstances(orderBy: {{field: NAME, direction: ASC}}) {{
-            upstreamFields {{
+            downstreamSheets {{
               name
-              upstreamDatabases {{
-                name
-              }}
-              upstreamTables {{
-                name
-              }}
-              upstreamColumns {{
+              worksheetFields {{
                 name
               }}
-              referencedByCalculations {{
-                name
-                formula
+              sheetFieldInstances(orderBy: {{field: NAME, direction: ASC}}) {{
                 upstreamFields {{
                   name
                   upstreamDatabases {{
@@ -107,6 +143,22 @@ graphql_query = f"""
                   upstreamColumns {{
                     name
                   }}
+                  referencedByCalculations {{
+                    name
+                    formula
+                    upstreamFields {{
+                      name
+                      upstreamDatabases {{
+                        name
+                      }}
+                      upstreamTables {{
+                        name
+                      }}
+                      upstreamColumns {{
+                        name
+                      }}
+                    }}
+                  }}
                 }}
               }}
             }}
@@ -114,17 +166,11 @@ graphql_query = f"""
         }}
       }}
     }}
-  }}
-}}
-"""
+    """
 
-# Make the request to the GraphQL endpoint (use updated headers with auth token)
-response = requests.post(metadata_api_url, json={'query': graphql_query}, headers=headers)
-response.raise_for_status()
-
-# Parse the JSON response
-data = response.json()
-print(json.dumps(data, indent=2))
+    # Make the request to the GraphQL endpoint and parse the JSON response
+    data = client.query(graphql_query)
+    return data
 
 def deduplicate_fields(fields):
     """ Function to remove duplicate upstream fields based on the 'name' key """
@@ -251,11 +297,188 @@ def process_calculations_with_upstream_fields(upstream_field, sheet_output):
             # Treat each referenced calculation as a separate entry
             sheet_output["upstreamFields"].append(calc_entry)
 
-# Generate the output
-lineage_output = build_lineage(data)
-
-# Write the output to a file to review
-with open('tableau_lineage.json', 'w') as f:
-    json.dump(lineage_output, f, indent=4)
-
-print("Lineage file generated successfully.")
+# Function to extract the Tableau lineage structure in memory
+def extract_tableau_lineage():
+    with create_client() as client:
+        published_datasource_ids = fetch_published_datasource_ids(client)
+        print(f"Published Datasource IDs: {published_datasource_ids}")
+        data = fetch_dashboard_lineage(client, published_datasource_ids)
+        # Debug dumps stay in the single-workbook path; site-wide runs call the helpers from many threads
+        print(json.dumps(data, indent=2))
+    return build_lineage(data)
+
+# Function to fetch one workbook's lineage with the datasource id filter split into chunks
+def fetch_workbook_lineage(client, published_datasource_ids, workbook_id, dashboard_name=None,
+                           chunk_size=DATASOURCE_ID_CHUNK_SIZE):
+    """
+    Runs one query per chunk of published datasource ids and merges the
+    dashboards' upstreamDatasources, so the query size stays bounded however
+    many datasources the site has. Returns the raw workbook, or None if not found.
+    """
+    id_chunks = [published_datasource_ids[start:start + chunk_size]
+                 for start in range(0, len(published_datasource_ids), chunk_size)] or [[]]
+    workbook = None
+    for id_chunk in id_chunks:
+        data = fetch_dashboard_lineage(client, id_chunk, workbook_ids=[workbook_id], dashboard_name=dashboard_name)
+        for chunk_workbook in data["data"]["workbooks"]:
+            if workbook is None:
+                workbook = chunk_workbook
+                continue
+            dashboards_by_id = {dashboard["id"]: dashboard for dashboard in workbook["dashboard"]}
+            for dashboard in chunk_workbook["dashboard"]:
+                if dashboard["id"] in dashboards_by_id:
+                    dashboards_by_id[dashboard["id"]]["upstreamDatasources"].extend(dashboard["upstreamDatasources"])
+                else:
+                    workbook["dashboard"].append(dashboard)
+    return workbook
+
+# Function to fetch and build the lineage of many workbooks in parallel
+def build_workbooks_lineage(client, published_datasource_ids, workbook_ids, dashboard_name=None,
+                            concurrency=DEFAULT_CONCURRENCY):
+    """
+    Returns [(workbook id, built workbook lineage)] in the order of workbook_ids,
+    skipping workbooks that were not found.
+    """
+    def fetch(workbook_id):
+        return fetch_workbook_lineage(client, published_datasource_ids, workbook_id, dashboard_name)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        workbooks = list(executor.map(fetch, workbook_ids))
+
+    return [
+        (workbook["id"], build_lineage({"data": {"workbooks": [workbook]}})["workbooks"][0])
+        for workbook in workbooks if workbook is not None
+    ]
+
+# Function to extract every workbook and dashboard on the site
+def extract_site_lineage(concurrency=DEFAULT_CONCURRENCY):
+    with create_client() as client:
+        published_datasource_ids = fetch_published_datasource_ids(client)
+        workbook_versions = fetch_workbook_versions(client, workbook_name=None)
+        print(f"Extracting {len(workbook_versions)} workbooks.")
+        return build_workbooks_lineage(client, published_datasource_ids,
+                                       [wb["id"] for wb in workbook_versions], concurrency=concurrency)
+
+# Function to refresh only the workbooks updated since the last run, using the local cache
+def refresh_tableau_lineage(cache_path=DEFAULT_CACHE_PATH, site_wide=False, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Lists workbook and datasource ids with their updatedAt (cheap, paginated),
+    fetches lineage only for workbooks updated after the cached watermark or not
+    cached yet, drops workbooks that no longer exist, and returns the merged
+    lineage from the cache as [(workbook id, workbook lineage)]. A changed or new
+    published datasource alters the idWithin filter of every workbook, and a
+    change of scope (site-wide or not) changes what is extracted, so both
+    trigger a full refresh.
+    """
+    scope = "site" if site_wide else f"{WORKBOOK_NAME}|{DASHBOARD_NAME}"
+    with create_client() as client, MetadataCache(cache_path) as cache:
+        published_datasources = fetch_published_datasources(client)
+        workbook_versions = fetch_workbook_versions(client, workbook_name=None if site_wide else WORKBOOK_NAME)
+
+        datasource_versions = {ds["id"]: ds.get("updatedAt") for ds in published_datasources}
+        if datasource_versions != cache.versions("datasource") or cache.get_watermark("scope") != scope:
+            print("Published datasources or scope changed; refreshing every workbook.")
+            cache.clear("workbook")
+            cache.clear("datasource")
+            for ds in published_datasources:
+                cache.upsert("datasource", ds["id"], ds["name"], ds.get("updatedAt"))
+            cache.set_watermark("scope", scope)
+
+        watermark = cache.get_watermark("workbook")
+        cached_workbooks = cache.versions("workbook")
+        changed_ids = [
+            wb["id"] for wb in workbook_versions
+            if wb["id"] not in cached_workbooks or watermark is None or (wb.get("updatedAt") or "") > watermark
+        ]
+        removed_ids = set(cached_workbooks) - {wb["id"] for wb in workbook_versions}
+        print(f"Workbooks: {len(workbook_versions)} in scope, {len(changed_ids)} to refresh, {len(removed_ids)} removed.")
+
+        cache.delete("workbook", removed_ids)
+        if changed_ids:
+            published_datasource_ids = fetch_published_datasource_ids(client, published_datasources=published_datasources)
+            if site_wide:
+                built = build_workbooks_lineage(client, published_datasource_ids, changed_ids, concurrency=concurrency)
+            else:
+                data = fetch_dashboard_lineage(client, published_datasource_ids, workbook_ids=changed_ids)
+                # build_lineage keeps the workbook order, so outputs line up with the response
+                built = [(workbook["id"], workbook_output) for workbook, workbook_output
+                         in zip(data["data"]["workbooks"], build_lineage(data)["workbooks"])]
+            versions = {wb["id"]: wb.get("updatedAt") for wb in workbook_versions}
+            for workbook_id, workbook_output in built:
+                cache.upsert("workbook", workbook_id, workbook_output["name"], versions.get(workbook_id), workbook_output)
+
+        updated_ats = [wb["updatedAt"] for wb in workbook_versions if wb.get("updatedAt")]
+        if updated_ats:
+            cache.set_watermark("workbook", max(updated_ats))
+        return cache.entries("workbook")
+
+# Function to write one lineage file per workbook plus an index of them
+def write_lineage_shards(workbook_entries, shard_dir=DEFAULT_SHARD_DIR):
+    """
+    workbook_entries is [(workbook id, workbook lineage)]. Each shard holds
+    {"workbooks": [workbook lineage]}, the same shape as tableau_lineage.json.
+    Shards of workbooks no longer on the site are removed; only files listed
+    in the previous index.json are ever deleted.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    index_path = os.path.join(shard_dir, "index.json")
+    previous_files = set()
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            previous_files = {entry["file"] for entry in json.load(f).get("workbooks", [])}
+
+    index = []
+    for workbook_id, workbook_output in workbook_entries:
+        shard_file = f"{workbook_id}.json"
+        with open(os.path.join(shard_dir, shard_file), 'w') as f:
+            json.dump({"workbooks": [workbook_output]}, f, indent=4)
+        index.append({"id": workbook_id, "name": workbook_output["name"], "file": shard_file})
+
+    current_files = {entry["file"] for entry in index}
+    for stale_file in previous_files - current_files:
+        stale_path = os.path.join(shard_dir, os.path.basename(stale_file))
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    with open(index_path, 'w') as f:
+        json.dump({"workbooks": index}, f, indent=4)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract Tableau dashboard lineage to tableau_lineage.json.")
+    parser.add_argument("--site", action="store_true",
+                        help=f"extract every workbook and dashboard on the site, not just '{WORKBOOK_NAME}'")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-extract workbooks updated since the last incremental run")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="SQLite metadata cache for --incremental")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="workbooks queried at once in --site mode")
+    parser.add_argument("--shard-dir", default=DEFAULT_SHARD_DIR,
+                        help="directory for the per-workbook lineage files written in --site mode")
+    args = parser.parse_args(argv)
+
+    # Generate the output
+    try:
+        if args.incremental:
+            workbook_entries = refresh_tableau_lineage(args.cache, site_wide=args.site, concurrency=args.concurrency)
+            lineage_output = {"workbooks": [workbook_output for _, workbook_output in workbook_entries]}
+        elif args.site:
+            workbook_entries = extract_site_lineage(args.concurrency)
+            lineage_output = {"workbooks": [workbook_output for _, workbook_output in workbook_entries]}
+        else:
+            lineage_output = extract_tableau_lineage()
+    except (requests.exceptions.RequestException, MetadataApiError) as e:
+        print(f"Request failed: {e}")
+        return
+
+    if args.site:
+        write_lineage_shards(workbook_entries, args.shard_dir)
+        print(f"Wrote {len(workbook_entries)} workbook shards to {args.shard_dir}.")
+
+    # Write the output to a file to review
+    with open('tableau_lineage.json', 'w') as f:
+        json.dump(lineage_output, f, indent=4)
+
+    print("Lineage file generated successfully.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import json
+import sqlite3
+
+# Default location of the local metadata cache
+DEFAULT_CACHE_PATH = '.tableau_metadata_cache.sqlite'
+
+# Define the MetadataCache class: Tableau objects keyed by id, with their updatedAt and built lineage
+class MetadataCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        """
+        objects holds one row per Tableau object (kind is 'workbook' or
+        'datasource'); payload is the object's JSON lineage, if any.
+        watermarks holds the newest updatedAt seen per kind at the last refresh.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (
+                kind TEXT NOT NULL,
+                id TEXT NOT NULL,
+                name TEXT,
+                updated_at TEXT,
+                payload TEXT,
+                PRIMARY KEY (kind, id)
+            );
+            CREATE TABLE IF NOT EXISTS watermarks (
+                kind TEXT PRIMARY KEY,
+                updated_at TEXT
+            );
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.conn.commit()
+        else:
+            self.conn.rollback()
+        self.close()
+
+    def get_watermark(self, kind):
+        row = self.conn.execute("SELECT updated_at FROM watermarks WHERE kind = ?", (kind,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, kind, updated_at):
+        self.conn.execute(
+            "INSERT INTO watermarks (kind, updated_at) VALUES (?, ?) "
+            "ON CONFLICT (kind) DO UPDATE SET updated_at = excluded.updated_at",
+            (kind, updated_at)
+        )
+
+    def versions(self, kind):
+        """Returns {id: updated_at} for every cached object of this kind."""
+        return dict(self.conn.execute("SELECT id, updated_at FROM objects WHERE kind = ?", (kind,)))
+
+    def upsert(self, kind, object_id, name, updated_at, payload=None):
+        self.conn.execute(
+            "INSERT INTO objects (kind, id, name, updated_at, payload) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (kind, id) DO UPDATE SET name = excluded.name, "
+            "updated_at = excluded.updated_at, payload = excluded.payload",
+            (kind, object_id, name, updated_at, None if payload is None else json.dumps(payload))
+        )
+
+    def delete(self, kind, object_ids):
+        self.conn.executemany("DELETE FROM objects WHERE kind = ? AND id = ?",
+                              [(kind, object_id) for object_id in object_ids])
+
+    def clear(self, kind):
+        self.conn.execute("DELETE FROM objects WHERE kind = ?", (kind,))
+        self.conn.execute("DELETE FROM watermarks WHERE kind = ?", (kind,))
+
+    def entries(self, kind):
+        """Returns [(id, payload)] for the cached objects of this kind, ordered by name then id."""
+        rows = self.conn.execute(
+            "SELECT id, payload FROM objects WHERE kind = ? AND payload IS NOT NULL ORDER BY name, id", (kind,)
+        )
+        return [(object_id, json.loads(payload)) for object_id, payload in rows]
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeouts in seconds for every request
+DEFAULT_TIMEOUT = (10, 120)
+
+# Retry policy for transient failures: rate limiting and server errors
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_FACTOR = 1.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Nodes requested per page by paginate()
+DEFAULT_PAGE_SIZE = 100
+
+# Function to key a GraphQL request for recording and replay; whitespace in the query is ignored
+def fixture_key(query, variables=None):
+    canonical = json.dumps({"query": " ".join(query.split()), "variables": variables or {}}, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:24]
+
+# Exception raised when the Metadata API returns GraphQL errors and no data
+class MetadataApiError(Exception):
+    def __init__(self, errors):
+        super().__init__("; ".join(error.get("message", str(error)) for error in errors))
+        self.errors = errors
+
+# Define the MetadataClient class: one pooled, retrying session per Tableau site
+class MetadataClient:
+    def __init__(self, server_url, api_version, token_name, token_value, site_id="",
+                 timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR, pool_size=10, record_dir=None):
+        """
+        server_url is the scheme and host, e.g. https://prod-apnortheast-a.online.tableau.com,
+        or a local stand-in server such as http://127.0.0.1:8765.
+        If record_dir is set, every GraphQL request and its response are saved
+        there as <fixture_key>.json for replay by tableau_standin_server.py.
+        """
+        self.server_url = server_url.rstrip("/")
+        self.auth_url = f"{self.server_url}/api/{api_version}/auth/signin"
+        self.signout_url = f"{self.server_url}/api/{api_version}/auth/signout"
+        self.metadata_api_url = f"{self.server_url}/api/metadata/graphql"
+        self.token_name = token_name
+        self.token_value = token_value
+        self.site_id = site_id
+        self.timeout = timeout
+        self.auth_token = None
+        self._auth_lock = threading.Lock()
+        self.record_dir = record_dir
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+
+        # Keep-alive connection pool with retry/backoff on 429 and 5xx (honours Retry-After)
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(["GET", "POST"]),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def sign_in(self):
+        """Signs in with the personal access token and stores the auth token."""
+        auth_payload = {
+            "credentials": {
+                "personalAccessTokenName": self.token_name,
+                "personalAccessTokenSecret": self.token_value,
+                "site": {"contentUrl": self.site_id}
+            }
+        }
+        response = self.session.post(self.auth_url, json=auth_payload, timeout=self.timeout)
+        response.raise_for_status()
+        self.auth_token = response.json()["credentials"]["token"]
+        print("Authenticated with Tableau.")
+        return self.auth_token
+
+    def _ensure_signed_in(self, expired_token=None):
+        # Only one thread signs in; others reuse the token it obtained
+        with self._auth_lock:
+            if self.auth_token is None or self.auth_token == expired_token:
+                self.sign_in()
+            return self.auth_token
+
+    def query(self, query, variables=None):
+        """
+        Runs a GraphQL query and returns the parsed JSON response. Signs in again
+        once if the token has expired. Raises requests.exceptions.RequestException
+        on HTTP failures (after retries) and MetadataApiError if the response has
+        errors and no data.
+        """
+        payload = {"query": query}
+        if variables:
+            payload["variables"] = variables
+
+        auth_token = self._ensure_signed_in()
+        response = self._post_query(payload, auth_token)
+        if response.status_code == 401:
+            print("Tableau auth token expired; signing in again.")
+            auth_token = self._ensure_signed_in(expired_token=auth_token)
+            response = self._post_query(payload, auth_token)
+        response.raise_for_status()
+
+        data = response.json()
+        if data.get("errors"):
+            if not data.get("data"):
+                raise MetadataApiError(data["errors"])
+            print(f"Metadata API returned partial data with errors: {data['errors']}")
+        if self.record_dir:
+            self._record(query, variables, data)
+        return data
+
+    def paginate(self, query, connection_path, variables=None, page_size=DEFAULT_PAGE_SIZE, after=None):
+        """
+        Yields the nodes of a ...Connection field one page at a time.
+        query must declare $first: Int and $after: String and pass them to the
+        connection, which must select nodes and pageInfo { hasNextPage endCursor }.
+        connection_path is the list of keys (ints index lists) leading from the
+        response's "data" to the connection; if any step is missing, nothing is yielded.
+        Pass after to resume from a cursor obtained elsewhere.
+        """
+        while True:
+            data = self.query(query, dict(variables or {}, first=page_size, after=after))
+            connection = data.get("data")
+            try:
+                for key in connection_path:
+                    connection = connection[key]
+            except (KeyError, IndexError, TypeError):
+                return
+            if connection is None:
+                return
+            yield connection.get("nodes", [])
+            page_info = connection.get("pageInfo") or {}
+            if not page_info.get("hasNextPage"):
+                return
+            after = page_info["endCursor"]
+
+    def _post_query(self, payload, auth_token):
+        return self.session.post(
+            self.metadata_api_url,
+            json=payload,
+            headers={"X-Tableau-Auth": auth_token},
+            timeout=self.timeout
+        )
+
+    def _record(self, query, variables, data):
+        fixture = {"query": query, "variables": variables or {}, "response": data}
+        path = os.path.join(self.record_dir, f"{fixture_key(query, variables)}.json")
+        with open(path, "w") as f:
+            json.dump(fixture, f, indent=2)
+
+    def close(self):
+        """Signs out (best effort) and closes the pooled connections."""
+        if self.auth_token is not None:
+            try:
+                self.session.post(self.signout_url, headers={"X-Tableau-Auth": self.auth_token}, timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                pass
+            self.auth_token = None
+        self.session.close()
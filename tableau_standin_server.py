@@ -0,0 +1,366 @@
+import argparse
+import glob
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tableau_metadata_client import fixture_key
+
+# Token handed out by the stand-in sign-in endpoint
+STANDIN_TOKEN = "standin-token"
+
+# Function to load recorded fixtures into {fixture_key: response}
+def load_fixtures(fixture_dir):
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(fixture_dir, "*.json"))):
+        with open(path, "r") as f:
+            fixture = json.load(f)
+        fixtures[fixture_key(fixture["query"], fixture.get("variables"))] = fixture["response"]
+    return fixtures
+
+# Function to build a synthetic Tableau site: N workbooks x M sheets x K calculated fields
+def build_synthetic_site(workbook_count, sheet_count, calc_count, column_count=10):
+    """
+    Every workbook has one dashboard ("Dashboard 1") containing all of its sheets
+    and reads one shared published datasource. Calc k references calc k - 1
+    (so calcs nest up to four deep) and one column. Sheet j shows two columns
+    plus every calc k with k % sheet_count == j.
+    """
+    datasource = {"id": "ds-0", "name": "Synthetic Source", "updatedAt": "2024-01-01T00:00:00Z"}
+    database = {"name": "SYNTHETIC_DB"}
+    columns = [
+        {"id": f"col-{c}", "name": f"COLUMN_{c}", "table": {"name": f"TABLE_{c % 3}", "schema": "PUBLIC"}}
+        for c in range(column_count)
+    ]
+
+    workbooks = []
+    calculated_fields = {}
+    for w in range(workbook_count):
+        workbook_id = f"wb-{w}"
+        calcs = []
+        for k in range(calc_count):
+            column = columns[k % column_count]
+            fields = [{
+                "id": f"{workbook_id}-field-{column['id']}",
+                "name": column["name"],
+                "__typename": "ColumnField",
+                "column": column
+            }]
+            if k % 4:
+                fields.insert(0, {"id": calcs[k - 1]["id"], "name": calcs[k - 1]["name"], "__typename": "CalculatedField"})
+            calc = {
+                "id": f"{workbook_id}-calc-{k}",
+                "name": f"Calc {k}",
+                "formula": f"[{fields[0]['name']}] + {k}",
+                "fields": fields
+            }
+            calcs.append(calc)
+            calculated_fields[calc["id"]] = calc
+
+        sheets = []
+        for j in range(sheet_count):
+            sheet_columns = [columns[(j + offset) % column_count] for offset in range(2)]
+            sheet_calcs = [calc for k, calc in enumerate(calcs) if k % max(sheet_count, 1) == j]
+            sheets.append({
+                "id": f"{workbook_id}-sheet-{j}",
+                "name": f"Sheet {j}",
+                "columns": sheet_columns,
+                "calcs": sheet_calcs
+            })
+
+        workbooks.append({
+            "id": workbook_id,
+            "name": f"Workbook {w}",
+            "projectName": "Synthetic",
+            "updatedAt": "2024-01-01T00:00:00Z",
+            "dashboards": [{"id": f"{workbook_id}-dashboard-0", "name": "Dashboard 1"}],
+            "sheets": sheets
+        })
+
+    return {
+        "datasources": [datasource],
+        "database": database,
+        "workbooks": workbooks,
+        "calculated_fields": calculated_fields
+    }
+
+# Define the SyntheticResolver class: answers the queries this repo sends from a synthetic site
+class SyntheticResolver:
+    def __init__(self, site):
+        self.site = site
+        self.datasource = site["datasources"][0]
+        self.workbooks_by_id = {wb["id"]: wb for wb in site["workbooks"]}
+
+    @staticmethod
+    def page(nodes, variables):
+        after = int(variables.get("after") or 0)
+        first = variables.get("first") or len(nodes)
+        end = after + first
+        return {
+            "nodes": nodes[after:end],
+            "pageInfo": {"hasNextPage": end < len(nodes), "endCursor": str(end)}
+        }
+
+    def resolve(self, query, variables):
+        match = re.search(r"\bquery\s+(\w+)", query)
+        operation = match.group(1) if match else None
+        resolver = getattr(self, f"resolve_{operation}", None)
+        if resolver is None:
+            return None
+        return {"data": resolver(query, variables)}
+
+    def column_upstreams(self, column):
+        return {
+            "upstreamDatabases": [self.site["database"]],
+            "upstreamTables": [column["table"]],
+            "upstreamColumns": [{"name": column["name"]}]
+        }
+
+    def workbook_header(self, workbook):
+        calc_refs = [
+            {"id": calc["id"], "name": calc["name"], "__typename": "CalculatedField"}
+            for sheet in workbook["sheets"] for calc in sheet["calcs"]
+        ]
+        return {
+            "id": workbook["id"],
+            "name": workbook["name"],
+            "projectName": workbook["projectName"],
+            "updatedAt": workbook["updatedAt"],
+            "dashboards": [dict(dashboard, upstreamFields=calc_refs) for dashboard in workbook["dashboards"]]
+        }
+
+    def sheet_node(self, workbook, sheet):
+        datasources = [{"name": self.datasource["name"]}]
+        instances = []
+        for column in sheet["columns"]:
+            instances.append(dict(
+                self.column_upstreams(column),
+                name=column["name"], id=f"{sheet['id']}-{column['id']}", __typename="ColumnField",
+                upstreamDatasources=datasources, upstreamFields=[]
+            ))
+        for calc in sheet["calcs"]:
+            instances.append({
+                "name": calc["name"], "id": f"{sheet['id']}-{calc['id']}", "__typename": "DatasourceField",
+                "upstreamDatasources": datasources, "upstreamDatabases": [], "upstreamTables": [],
+                "upstreamColumns": [],
+                "upstreamFields": [{"id": calc["id"], "name": calc["name"], "__typename": "CalculatedField"}]
+            })
+        return {
+            "id": sheet["id"],
+            "name": sheet["name"],
+            "__typename": "Sheet",
+            "containedInDashboards": [{"name": dashboard["name"]} for dashboard in workbook["dashboards"]],
+            "sheetFieldInstances": instances
+        }
+
+    def resolve_publishedDatasources(self, query, variables):
+        return {"publishedDatasourcesConnection": self.page(self.site["datasources"], variables)}
+
+    def resolve_workbookVersions(self, query, variables):
+        name = variables.get("workbookName")
+        nodes = [
+            {"id": wb["id"], "name": wb["name"], "updatedAt": wb["updatedAt"]}
+            for wb in self.site["workbooks"] if name is None or wb["name"] == name
+        ]
+        return {"workbooksConnection": self.page(nodes, variables)}
+
+    def resolve_workbookDetails(self, query, variables):
+        name = variables.get("workbookName")
+        return {"workbooks": [self.workbook_header(wb) for wb in self.site["workbooks"] if wb["name"] == name]}
+
+    def resolve_workbooksDetails(self, query, variables):
+        names = set(variables.get("workbookNames") or [])
+        workbooks = []
+        for wb in self.site["workbooks"]:
+            if wb["name"] in names:
+                sheets = [self.sheet_node(wb, sheet) for sheet in wb["sheets"]]
+                workbooks.append(dict(self.workbook_header(wb), sheetsConnection=self.page(sheets, variables)))
+        return {"workbooks": workbooks}
+
+    def resolve_workbookSheets(self, query, variables):
+        wb = self.workbooks_by_id.get(variables.get("workbookId"))
+        if wb is None:
+            return {"workbooks": []}
+        sheets = [self.sheet_node(wb, sheet) for sheet in wb["sheets"]]
+        return {"workbooks": [{"sheetsConnection": self.page(sheets, variables)}]}
+
+    def resolve_calculatedFieldDetails(self, query, variables):
+        calcs = []
+        for calc_id in variables.get("fieldIds") or []:
+            calc = self.site["calculated_fields"].get(calc_id)
+            if calc is None:
+                continue
+            fields = []
+            for field in calc["fields"]:
+                if field["__typename"] == "ColumnField":
+                    fields.append(dict(self.column_upstreams(field["column"]),
+                                       id=field["id"], name=field["name"], __typename="ColumnField", upstreamFields=[]))
+                else:
+                    fields.append(dict(field, upstreamTables=[], upstreamColumns=[], upstreamDatabases=[], upstreamFields=[]))
+            calcs.append({"id": calc["id"], "name": calc["name"], "formula": calc["formula"], "fields": fields})
+        return {"calculatedFields": calcs}
+
+    def resolve_dashboardLineage(self, query, variables):
+        # Filters are inlined in this query, so read them from the query text
+        workbook_filter = re.search(r"workbooks\(filter:\s*\{(.*?)\}\)", query, re.S).group(1)
+        dashboard_match = re.search(r"dashboards\(filter:\s*\{name:\s*\"(.*?)\"\}\)", query)
+        dashboard_name = dashboard_match.group(1) if dashboard_match else None
+        datasource_ids = set(re.findall(r"\"(.*?)\"", re.search(r"upstreamDatasources\(filter:\s*\{idWithin:\s*\[(.*?)\]", query).group(1)))
+        if "idWithin" in workbook_filter:
+            wanted_ids = set(re.findall(r"\"(.*?)\"", workbook_filter))
+            workbooks = [wb for wb in self.site["workbooks"] if wb["id"] in wanted_ids]
+        else:
+            name = re.search(r"name:\s*\"(.*?)\"", workbook_filter).group(1)
+            workbooks = [wb for wb in self.site["workbooks"] if wb["name"] == name]
+
+        result = []
+        for wb in workbooks:
+            dashboards = []
+            for dashboard in wb["dashboards"]:
+                if dashboard_name is not None and dashboard["name"] != dashboard_name:
+                    continue
+                sheets = []
+                for sheet in wb["sheets"]:
+                    upstream_fields = []
+                    for column in sheet["columns"]:
+                        referenced_by = [
+                            {"name": calc["name"], "formula": calc["formula"], "upstreamFields": [
+                                dict(self.column_upstreams(field["column"]), name=field["name"])
+                                for field in calc["fields"] if field["__typename"] == "ColumnField"
+                            ]}
+                            for calc in sheet["calcs"]
+                            if any(field.get("column") is column for field in calc["fields"])
+                        ]
+                        upstream_fields.append(dict(self.column_upstreams(column), name=column["name"],
+                                                    referencedByCalculations=referenced_by))
+                    sheets.append({
+                        "name": sheet["name"],
+                        "worksheetFields": [{"name": column["name"]} for column in sheet["columns"]],
+                        "sheetFieldInstances": [{"upstreamFields": [field]} for field in upstream_fields]
+                    })
+                dashboards.append({
+                    "name": dashboard["name"],
+                    "id": dashboard["id"],
+                    "upstreamDatasources": [
+                        {"name": self.datasource["name"], "downstreamSheets": sheets}
+                    ] if self.datasource["id"] in datasource_ids else []
+                })
+            result.append({"id": wb["id"], "name": wb["name"], "dashboard": dashboards})
+        return {"workbooks": result}
+
+# Define the StandinServer class: a local HTTP stand-in for the Tableau REST sign-in and Metadata API
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fixtures=None, resolver=None, latency=0.0):
+        """
+        Recorded fixtures are tried first, then the synthetic resolver. latency
+        (seconds) is added to every request to mimic a remote server.
+        """
+        super().__init__(address, StandinRequestHandler)
+        self.fixtures = fixtures or {}
+        self.resolver = resolver
+        self.latency = latency
+        self.request_counts = {}
+        self._counts_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, operation):
+        with self._counts_lock:
+            self.request_counts[operation] = self.request_counts.get(operation, 0) + 1
+
+    def reset_counts(self):
+        with self._counts_lock:
+            self.request_counts = {}
+
+    def answer(self, query, variables):
+        key = fixture_key(query, variables)
+        if key in self.fixtures:
+            return self.fixtures[key]
+        if self.resolver is not None:
+            response = self.resolver.resolve(query, variables)
+            if response is not None:
+                return response
+        return {"errors": [{"message": f"No fixture or synthetic answer for request {key}"}]}
+
+class StandinRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.path.endswith("/auth/signin"):
+            self.server.count("signin")
+            self.send_json(200, {"credentials": {"token": STANDIN_TOKEN, "site": {"id": "standin-site"}}})
+        elif self.path.endswith("/auth/signout"):
+            self.server.count("signout")
+            self.send_response(204)
+            self.end_headers()
+        elif self.path == "/api/metadata/graphql":
+            query = body.get("query", "")
+            match = re.search(r"\bquery\s+(\w+)", query)
+            self.server.count(match.group(1) if match else "anonymous")
+            self.send_json(200, self.server.answer(query, body.get("variables")))
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+# Function to start a stand-in server on a background thread
+def start_server(host="127.0.0.1", port=0, fixtures=None, resolver=None, latency=0.0):
+    server = StandinServer((host, port), fixtures=fixtures, resolver=resolver, latency=latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded or synthetic Tableau Metadata API responses locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", help="directory of fixtures recorded with TABLEAU_RECORD_DIR")
+    parser.add_argument("--synthetic", nargs=3, type=int, metavar=("WORKBOOKS", "SHEETS", "CALCS"),
+                        help="also answer from a synthetic site of this size")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every request")
+    parser.add_argument("--write-workbooks-file", metavar="PATH",
+                        help="write the synthetic workbook names, one per line, for workbook_lineage.py")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else {}
+    resolver = None
+    if args.synthetic:
+        site = build_synthetic_site(*args.synthetic)
+        resolver = SyntheticResolver(site)
+        if args.write_workbooks_file:
+            with open(args.write_workbooks_file, "w") as f:
+                f.writelines(f"{wb['name']}\n" for wb in site["workbooks"])
+
+    server = StandinServer((args.host, args.port), fixtures=fixtures, resolver=resolver,
+                           latency=args.latency_ms / 1000)
+    print(f"Serving {len(fixtures)} fixtures{' and a synthetic site' if resolver else ''} on {server.url}")
+    print(f"Point the scripts at it with TABLEAU_SERVER_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
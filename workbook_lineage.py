@@ -1,169 +1,214 @@
+import argparse
 import json
-import requests
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 
+from tableau_metadata_client import MetadataClient, DEFAULT_PAGE_SIZE
+
 # =============================================================================
 # REPLACE THESE WITH YOUR TABLEAU ONLINE DETAILS
 # =============================================================================
 instance = "prod-apnortheast-a"
 api_version = "3.24"
-auth_url = f"https://{instance}.online.tableau.com/api/{api_version}/auth/signin"
+
+# Override to point at another server, e.g. a local stand-in for testing
+server_url = os.getenv("TABLEAU_SERVER_URL", f"https://{instance}.online.tableau.com")
+
+# Set to a directory to record every GraphQL request/response as a replay fixture
+record_dir = os.getenv("TABLEAU_RECORD_DIR")
 
 token_name = "test"
 token_value = ""
 site_id = ""
 
-auth_payload = {
-    "credentials": {
-        "personalAccessTokenName": token_name,
-        "personalAccessTokenSecret": token_value,
-        "site": {"contentUrl": site_id}
-    }
-}
-
-auth_headers = {
-    'Content-Type': 'application/json',
-    'Accept': 'application/json'
-}
-
 # =============================================================================
-# AUTHENTICATE AND OBTAIN TOKEN
+# METADATA API CLIENT (POOLED SESSION, RETRIES, RE-SIGN-IN ON EXPIRY)
 # =============================================================================
-try:
-    response = requests.post(auth_url, json=auth_payload, headers=auth_headers)
-    response.raise_for_status()
-    data = response.json()
-    auth_token = data['credentials']['token']
-    print(f"Authenticated with token: {auth_token}")
-except requests.exceptions.RequestException as e:
-    print(f"Request failed: {e}")
-    exit()
+def create_client(pool_size=10):
+    return MetadataClient(server_url, api_version, token_name, token_value, site_id, pool_size=pool_size,
+                          record_dir=record_dir)
 
-# =============================================================================
-# METADATA API ENDPOINT & HEADERS
-# =============================================================================
-metadata_api_url = f"https://{instance}.online.tableau.com/api/metadata/graphql"
-headers = {
-    "Content-Type": "application/json",
-    "X-Tableau-Auth": auth_token
-}
+# Workbooks extracted in parallel by main(); the Metadata API rate-limits, so keep this modest
+DEFAULT_CONCURRENCY = 8
+
+# Maximum ids per calculatedFields idWithin query
+CALC_ID_CHUNK_SIZE = 100
+
+# Workbooks requested per nameWithin query in batched mode
+WORKBOOK_BATCH_SIZE = 10
 
 # =============================================================================
-# 1. GRAPHQL QUERY (INCLUDES upstreamFields FOR SHEET FIELDS)
+# 1. GRAPHQL QUERIES: WORKBOOK HEADER, THEN SHEETS PAGE BY PAGE
 # =============================================================================
-def get_workbook_details(workbook_name):
-    query = f"""
-    {{
-      workbooks(filter: {{name: "{workbook_name}"}}) {{
+# Sheet selection shared by the per-workbook and batched queries
+SHEET_FIELDS = """
+            id
+            name
+            __typename
+            containedInDashboards {
+              name
+            }
+            sheetFieldInstances {
+              name
+              __typename
+              id
+              upstreamDatasources {
+                name
+              }
+              upstreamDatabases {
+                name
+              }
+              upstreamTables {
+                name
+                schema
+              }
+              upstreamColumns {
+                name
+              }
+              upstreamFields {
+                id
+                name
+                __typename
+              }
+            }
+"""
+
+def get_workbook_details(client, workbook_name):
+    """
+    Fetches the workbook and its dashboards. Sheets are fetched separately
+    with iter_workbook_sheets so large workbooks are never one huge payload.
+    """
+    query = """
+    query workbookDetails($workbookName: String) {
+      workbooks(filter: {name: $workbookName}) {
         id
         name
-        dashboards {{
+        dashboards {
           name
-          upstreamFields {{
+          upstreamFields {
             id
             name
             __typename
-          }}
-        }}
+          }
+        }
         projectName
-        sheets {{
-          id
+      }
+    }
+    """
+    return client.query(query, {"workbookName": workbook_name})
+
+def get_workbooks_details(client, workbook_names, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Fetches several workbooks in one query via nameWithin, each with its
+    dashboards and the first page of its sheets. Remaining sheet pages are
+    fetched with iter_workbook_sheets starting from the returned endCursor.
+    """
+    query = """
+    query workbooksDetails($workbookNames: [String], $first: Int) {
+      workbooks(filter: {nameWithin: $workbookNames}) {
+        id
+        name
+        dashboards {
           name
-          __typename
-          containedInDashboards {{
-            name
-          }}
-          sheetFieldInstances {{
+          upstreamFields {
+            id
             name
             __typename
-            id
-            upstreamDatasources {{
-              name
-            }}
-            upstreamDatabases {{
-              name
-            }}
-            upstreamTables {{
-              name
-              schema
-            }}
-            upstreamColumns {{
-              name
-            }}
-            upstreamFields {{
-              id
-              name
-              __typename
-            }}
-          }}
-        }}
-      }}
-    }}
+          }
+        }
+        projectName
+        sheetsConnection(first: $first) {
+          nodes {""" + SHEET_FIELDS + """          }
+          pageInfo {
+            hasNextPage
+            endCursor
+          }
+        }
+      }
+    }
     """
-    response = requests.post(metadata_api_url, json={'query': query}, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    return client.query(query, {"workbookNames": list(workbook_names), "first": page_size})
+
+def iter_workbook_sheets(client, workbook_id, page_size=DEFAULT_PAGE_SIZE, after=None):
+    """
+    Yields the workbook's sheets (including upstreamFields for sheet fields)
+    one page at a time via the paginated sheetsConnection.
+    """
+    query = """
+    query workbookSheets($workbookId: ID, $first: Int, $after: String) {
+      workbooks(filter: {id: $workbookId}) {
+        sheetsConnection(first: $first, after: $after) {
+          nodes {""" + SHEET_FIELDS + """          }
+          pageInfo {
+            hasNextPage
+            endCursor
+          }
+        }
+      }
+    }
+    """
+    yield from client.paginate(query, ["workbooks", 0, "sheetsConnection"],
+                               variables={"workbookId": workbook_id}, page_size=page_size, after=after)
 
 # =============================================================================
 # 2. GRAPHQL QUERY FOR BATCH FETCHING CALCULATEDFIELDS
 # =============================================================================
-def get_calculated_field_details(field_ids):
+def get_calculated_field_details(client, field_ids):
     if not field_ids:
         return {}
-    id_within_str = '", "'.join(field_ids)
-    id_within_filter = f'["{id_within_str}"]'
-    query = f"""
-    {{
-      calculatedFields(filter: {{idWithin: {id_within_filter}}}) {{
+    query = """
+    query calculatedFieldDetails($fieldIds: [ID]) {
+      calculatedFields(filter: {idWithin: $fieldIds}) {
         name
         id
         formula
-        fields {{
+        fields {
           name
           id
           __typename
-          upstreamTables {{
+          upstreamTables {
             name
-          }}
-          upstreamColumns {{
+          }
+          upstreamColumns {
             name
-          }}
-          upstreamDatabases {{
+          }
+          upstreamDatabases {
             name
-          }}
-          upstreamFields {{
+          }
+          upstreamFields {
             id
             name
             __typename
-          }}
-        }}
-      }}
-    }}
+          }
+        }
+      }
+    }
     """
-    response = requests.post(metadata_api_url, json={'query': query}, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    return client.query(query, {"fieldIds": list(field_ids)})
 
 # =============================================================================
-# 3. RECURSIVE TRAVERSAL FOR CALCULATED FIELDS
+# 3. CALCULATED FIELD LINEAGE (MEMOIZED PER WORKBOOK)
 # =============================================================================
-def traverse_upstream_fields(current_field_id, calculated_fields_dict, lineage_rows, context, visited):
+def calc_lineage_entries(calc_field_id, parent_field_name, calculated_fields_dict, calc_lineage_cache):
     """
-    Recursive traversal of calculated fields, with duplicate prevention.
+    Returns the context-free lineage of one calculated field as a list of
+    ("row", row without the sheet/dashboard columns) and ("calc", id, name)
+    entries, the latter marking where a nested calc's lineage goes. Entries are
+    computed once per (calc, parent name) and cached for the whole workbook.
     """
-    # Skip if already visited
-    if current_field_id in visited:
-        return
-    visited.add(current_field_id)  # Mark this field as visited
+    cache_key = (calc_field_id, parent_field_name)
+    if cache_key in calc_lineage_cache:
+        return calc_lineage_cache[cache_key]
+
+    entries = []
+    calc_lineage_cache[cache_key] = entries
 
     # If no data => unknown
-    if current_field_id not in calculated_fields_dict:
-        lineage_rows.append({
-            "workbook_name": context["workbook_name"],
-            "worksheet_name": context["sheet_name"],
-            "data_source_name": context["data_source_name"],
-            "dashboard_name": context["dashboard_name"],
-            "field_name": context["parent_field_name"],
+    if calc_field_id not in calculated_fields_dict:
+        entries.append(("row", {
+            "field_name": parent_field_name,
             "field_type": "CalculatedField",
             "upstream_field_name": "UNKNOWN",
             "upstream_field_type": "UNKNOWN",
@@ -172,22 +217,18 @@ def traverse_upstream_fields(current_field_id, calculated_fields_dict, lineage_r
             "upstream_table": "",
             "upstream_schema": "",
             "upstream_database": ""
-        })
-        return
+        }))
+        return entries
 
-    cal_field_data = calculated_fields_dict[current_field_id]
+    cal_field_data = calculated_fields_dict[calc_field_id]
     cal_field_name = cal_field_data["name"]
     cal_field_formula = cal_field_data["formula"]
     upstreams = cal_field_data.get("fields", [])
 
     # If no upstream => constant/noUpstream
     if not upstreams:
-        lineage_rows.append({
-            "workbook_name": context["workbook_name"],
-            "worksheet_name": context["sheet_name"],
-            "data_source_name": context["data_source_name"],
-            "dashboard_name": context["dashboard_name"],
-            "field_name": context["parent_field_name"],
+        entries.append(("row", {
+            "field_name": parent_field_name,
             "field_type": "CalculatedField",
             "upstream_field_name": cal_field_name,
             "upstream_field_type": "Constant/NoUpstream",
@@ -196,8 +237,8 @@ def traverse_upstream_fields(current_field_id, calculated_fields_dict, lineage_r
             "upstream_table": "",
             "upstream_schema": "",
             "upstream_database": ""
-        })
-        return
+        }))
+        return entries
 
     # Process upstream fields
     for upstream_field in upstreams:
@@ -211,12 +252,8 @@ def traverse_upstream_fields(current_field_id, calculated_fields_dict, lineage_r
         up_dbs = upstream_field.get("upstreamDatabases", [])
 
         # Add row for this upstream field
-        lineage_rows.append({
-            "workbook_name": context["workbook_name"],
-            "worksheet_name": context["sheet_name"],
-            "data_source_name": context["data_source_name"],
-            "dashboard_name": context["dashboard_name"],
-            "field_name": context["parent_field_name"],
+        entries.append(("row", {
+            "field_name": parent_field_name,
             "field_type": "CalculatedField",
             "upstream_field_name": up_name,
             "upstream_field_type": up_type,
@@ -225,63 +262,141 @@ def traverse_upstream_fields(current_field_id, calculated_fields_dict, lineage_r
             "upstream_table": ", ".join(tbl["name"] for tbl in up_tables) if up_tables else "",
             "upstream_schema": "",
             "upstream_database": ", ".join(db["name"] for db in up_dbs) if up_dbs else ""
-        })
+        }))
 
-        # Recursive traversal for calculated fields
+        # Nested calculated fields are expanded where they appear
         if up_type == "CalculatedField":
+            entries.append(("calc", up_id, up_name))
+
+    return entries
+
+def traverse_upstream_fields(current_field_id, calculated_fields_dict, lineage_rows, context, visited, calc_lineage_cache):
+    """
+    Stamps out the cached lineage of a calculated field for one sheet/dashboard
+    context. visited is per context: each calc is emitted once per context, and
+    cycles between calcs terminate.
+    """
+    # Skip if already emitted in this context
+    if current_field_id in visited:
+        return
+    visited.add(current_field_id)
+
+    entries = calc_lineage_entries(current_field_id, context["parent_field_name"], calculated_fields_dict, calc_lineage_cache)
+    for entry in entries:
+        if entry[0] == "row":
+            lineage_rows.append({
+                "workbook_name": context["workbook_name"],
+                "worksheet_name": context["sheet_name"],
+                "data_source_name": context["data_source_name"],
+                "dashboard_name": context["dashboard_name"],
+                **entry[1]
+            })
+        else:
+            _, up_id, up_name = entry
             new_context = context.copy()
             new_context["parent_field_name"] = up_name
-            traverse_upstream_fields(up_id, calculated_fields_dict, lineage_rows, new_context, visited)
+            traverse_upstream_fields(up_id, calculated_fields_dict, lineage_rows, new_context, visited, calc_lineage_cache)
 
 # =============================================================================
-# 4. PROCESS SINGLE WORKBOOK (FIX DUPLICATES WITH VISITED TRACKING)
+# 4. PROCESS SINGLE WORKBOOK
 # =============================================================================
-def process_single_workbook(wb_name):
-    wb_json_data = get_workbook_details(wb_name)
-    workbooks_data = wb_json_data.get("data", {}).get("workbooks", [])
-    if not workbooks_data:
-        print(f"No workbook found with name '{wb_name}'. Skipping.")
-        return pd.DataFrame()
-
-    workbook_obj = workbooks_data[0]
-    workbook_name = workbook_obj["name"]
-
-    # Gather calculated field IDs
-    dashboards = workbook_obj.get("dashboards", [])
+def fetch_calculated_fields(client, calc_field_ids, calc_field_lookup, chunk_size=CALC_ID_CHUNK_SIZE):
+    """
+    Resolves the calculated fields not yet in calc_field_lookup, plus every
+    calculated field they reference, breadth first. Each level of the
+    dependency graph is one batch of idWithin queries (chunk_size ids each),
+    so a chain of nested calcs costs as many rounds as it is deep.
+    """
+    requested = set(calc_field_lookup)
+    frontier = sorted(set(calc_field_ids) - requested)
+    while frontier:
+        requested.update(frontier)
+        discovered = set()
+        for start in range(0, len(frontier), chunk_size):
+            calculated_fields_details = get_calculated_field_details(client, frontier[start:start + chunk_size])
+            calc_fields_data = calculated_fields_details.get("data", {}).get("calculatedFields", [])
+            for cfd in calc_fields_data:
+                cfd_id = cfd["id"]
+                calc_field_lookup[cfd_id] = {
+                    "name": cfd["name"],
+                    "formula": cfd["formula"],
+                    "fields": cfd.get("fields", [])
+                }
+                # Calcs referenced by this calc go into the next level
+                for upstream_field in cfd.get("fields", []) or []:
+                    if upstream_field["__typename"] == "CalculatedField":
+                        discovered.add(upstream_field["id"])
+        frontier = sorted(discovered - requested)
+
+# Function to gather the calculated field IDs referenced by dashboards
+def dashboard_calc_field_ids(dashboards):
     calc_field_ids = []
     for dash in dashboards:
         for field in dash.get("upstreamFields", []):
             if field["__typename"] == "CalculatedField":
                 calc_field_ids.append(field["id"])
+    return calc_field_ids
 
-    sheets = workbook_obj.get("sheets", [])
+# Function to gather the calculated field IDs referenced by sheet fields
+def sheet_calc_field_ids(sheets):
+    calc_field_ids = []
     for sheet in sheets:
         for sf in sheet.get("sheetFieldInstances", []):
             if sf["__typename"] == "DatasourceField":
                 for uf in sf.get("upstreamFields", []):
                     if uf["__typename"] == "CalculatedField":
                         calc_field_ids.append(uf["id"])
+    return calc_field_ids
 
-    calc_field_ids = list(set(calc_field_ids))
+# Function to collect (sheet name, field name) for every sheetFieldInstance
+def add_primary_fields(sheets, primary_fields):
+    """
+    The sheets already carry their sheetFieldInstances, so the primary-field
+    set comes from the same response instead of a second query.
+    """
+    for sheet in sheets:
+        sheet_name = sheet["name"]
+        for field_instance in sheet.get("sheetFieldInstances", []):
+            primary_fields.add((sheet_name, field_instance["name"]))
 
-    # Batch fetch calculated fields
-    calculated_fields_details = get_calculated_field_details(calc_field_ids)
-    calc_fields_data = calculated_fields_details.get("data", {}).get("calculatedFields", [])
+def process_single_workbook(client, wb_name, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Returns (lineage DataFrame, primary fields) for one workbook, streaming its sheets.
+    """
+    wb_json_data = get_workbook_details(client, wb_name)
+    workbooks_data = wb_json_data.get("data", {}).get("workbooks", [])
+    if not workbooks_data:
+        print(f"No workbook found with name '{wb_name}'. Skipping.")
+        return pd.DataFrame(), set()
+
+    workbook_obj = workbooks_data[0]
+    workbook_name = workbook_obj["name"]
+
+    # Batch fetch calculated fields referenced by dashboards
     calc_field_lookup = {}
-    for cfd in calc_fields_data:
-        cfd_id = cfd["id"]
-        calc_field_lookup[cfd_id] = {
-            "name": cfd["name"],
-            "formula": cfd["formula"],
-            "fields": cfd.get("fields", [])
-        }
+    fetch_calculated_fields(client, dashboard_calc_field_ids(workbook_obj.get("dashboards", [])), calc_field_lookup)
 
-    # Build lineage data
     lineage_data = []
-    visited = set()  # Track visited fields to prevent duplicates
+    primary_fields = set()
+    calc_lineage_cache = {}  # Calc lineage computed once, reused by every sheet
+
+    # Stream sheets page by page: fetch any new calculated fields, then build rows
+    for sheets in iter_workbook_sheets(client, workbook_obj["id"], page_size):
+        fetch_calculated_fields(client, sheet_calc_field_ids(sheets), calc_field_lookup)
+        build_sheet_lineage(sheets, workbook_name, calc_field_lookup, lineage_data, calc_lineage_cache)
+        add_primary_fields(sheets, primary_fields)
+
+    return pd.DataFrame(lineage_data), primary_fields
+
+def build_sheet_lineage(sheets, workbook_name, calc_field_lookup, lineage_data, calc_lineage_cache):
+    """
+    Appends the lineage rows for one page of sheets to lineage_data.
+    calc_lineage_cache must be shared by all pages of the same workbook.
+    """
     for sheet in sheets:
         sheet_name = sheet["name"]
         dash_names = [d["name"] for d in sheet.get("containedInDashboards", [])] or ["NoDashboard"]
+        visited_by_dashboard = {dash_name: set() for dash_name in dash_names}
 
         for sf in sheet.get("sheetFieldInstances", []):
             field_name = sf["name"]
@@ -323,93 +438,241 @@ def process_single_workbook(wb_name):
                             "dashboard_name": dash_name,
                             "parent_field_name": uf["name"]
                         }
-                        traverse_upstream_fields(uf["id"], calc_field_lookup, lineage_data, context, visited)
-
-    return pd.DataFrame(lineage_data)
+                        traverse_upstream_fields(uf["id"], calc_field_lookup, lineage_data, context,
+                                                 visited_by_dashboard[dash_name], calc_lineage_cache)
 
 # =============================================================================
-# NEW: Fetch all sheetFieldInstances for marking primary fields
+# 5. EXTRACT WORKBOOKS (SAFE TO RUN IN PARALLEL THREADS)
 # =============================================================================
-def get_sheet_field_instances(workbook_name):
+# Function to flag the lineage rows whose (sheet, field) is a sheetFieldInstance
+def flag_primary_fields(df_lineage, primary_fields):
     """
-    Fetches all sheetFieldInstances with their sheet names and field names
-    for the given workbook. This will be used to flag primary fields
-    in the lineage data.
+    Sets 'is_primary' with a left join against the primary-field set instead
+    of a per-row lookup. A left merge keeps the row order of df_lineage.
     """
-    query = f"""
-    {{
-      workbooks(filter: {{name: "{workbook_name}"}}) {{
-        sheets {{
-          name
-          sheetFieldInstances {{
-            name
-          }}
-        }}
-      }}
-    }}
+    df_primary = pd.DataFrame(sorted(primary_fields), columns=["worksheet_name", "field_name"])
+    df_primary["is_primary"] = True
+    df_lineage = df_lineage.drop(columns="is_primary", errors="ignore").merge(
+        df_primary, on=["worksheet_name", "field_name"], how="left"
+    )
+    df_lineage["is_primary"] = df_lineage["is_primary"].fillna(False).astype(bool)
+    return df_lineage
+
+def extract_workbook_lineage(client, wb_name, page_size=DEFAULT_PAGE_SIZE):
     """
-    response = requests.post(metadata_api_url, json={'query': query}, headers=headers)
-    response.raise_for_status()
-    data = response.json()
-    
-    # Extract all sheetFieldInstance names and their sheet names
-    primary_fields = set()
-    sheets = data.get("data", {}).get("workbooks", [])[0].get("sheets", [])
-    for sheet in sheets:
-        sheet_name = sheet["name"]
-        for field_instance in sheet.get("sheetFieldInstances", []):
-            field_name = field_instance["name"]
-            primary_fields.add((sheet_name, field_name))
-    
-    return primary_fields
+    Runs the per-workbook round trips and returns the lineage DataFrame with
+    'is_primary' set. Only prints and the shared client are touched, so several
+    workbooks can be extracted at once.
+    """
+    df_lineage, primary_fields = process_single_workbook(client, wb_name, page_size)
+    if df_lineage.empty:
+        return df_lineage
+    print(f" - {wb_name}: found {len(primary_fields)} sheetFieldInstances for primary fields.")
+    return flag_primary_fields(df_lineage, primary_fields)
+
+def extract_workbook_batch(client, wb_names, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Batched mode: fetches all of wb_names with one nameWithin query, then
+    resolves the calculated fields of every workbook in the batch together, so
+    calcs shared through a common datasource are fetched once.
+    Returns {workbook name: lineage DataFrame}, empty for workbooks not found.
+    """
+    wb_json_data = get_workbooks_details(client, wb_names, page_size)
+    workbooks_by_name = {}
+    for workbook_obj in wb_json_data.get("data", {}).get("workbooks", []):
+        workbooks_by_name.setdefault(workbook_obj["name"], workbook_obj)
+
+    # Collect every sheet, following the pagination of workbooks with more pages
+    sheets_by_name = {}
+    calc_field_ids = []
+    for wb_name, workbook_obj in workbooks_by_name.items():
+        connection = workbook_obj.get("sheetsConnection") or {}
+        sheets = list(connection.get("nodes", []))
+        page_info = connection.get("pageInfo") or {}
+        if page_info.get("hasNextPage"):
+            for more_sheets in iter_workbook_sheets(client, workbook_obj["id"], page_size, after=page_info["endCursor"]):
+                sheets.extend(more_sheets)
+        sheets_by_name[wb_name] = sheets
+        calc_field_ids.extend(dashboard_calc_field_ids(workbook_obj.get("dashboards", [])))
+        calc_field_ids.extend(sheet_calc_field_ids(sheets))
+
+    # One breadth-first resolution for the whole batch
+    calc_field_lookup = {}
+    fetch_calculated_fields(client, calc_field_ids, calc_field_lookup)
+
+    results = {}
+    for wb_name in wb_names:
+        if wb_name not in workbooks_by_name:
+            print(f"No workbook found with name '{wb_name}'. Skipping.")
+            results[wb_name] = pd.DataFrame()
+            continue
+        sheets = sheets_by_name[wb_name]
+        lineage_data = []
+        build_sheet_lineage(sheets, wb_name, calc_field_lookup, lineage_data, {})
+        df_lineage = pd.DataFrame(lineage_data)
+        if not df_lineage.empty:
+            primary_fields = set()
+            add_primary_fields(sheets, primary_fields)
+            df_lineage = flag_primary_fields(df_lineage, primary_fields)
+        results[wb_name] = df_lineage
+    return results
+
+def iter_workbook_lineage(client, workbook_names, batch_size=WORKBOOK_BATCH_SIZE,
+                          concurrency=DEFAULT_CONCURRENCY, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Extracts the workbooks on a thread pool and yields (workbook name, lineage
+    DataFrame) in input order. A workbook that fails or is not found yields an
+    empty DataFrame.
+    """
+    def extract(wb_name):
+        print(f"Processing workbook: {wb_name}")
+        try:
+            return [extract_workbook_lineage(client, wb_name, page_size)]
+        except Exception as e:
+            print(f"Error processing workbook '{wb_name}': {e}")
+            return [pd.DataFrame()]
+
+    def extract_batch(wb_names):
+        print(f"Processing workbooks: {', '.join(wb_names)}")
+        try:
+            results = extract_workbook_batch(client, wb_names, page_size)
+            return [results[wb_name] for wb_name in wb_names]
+        except Exception as e:
+            print(f"Error processing workbooks {wb_names}: {e}")
+            return [pd.DataFrame() for _ in wb_names]
+
+    if batch_size > 1:
+        units = [workbook_names[start:start + batch_size]
+                 for start in range(0, len(workbook_names), batch_size)]
+        extract_unit = extract_batch
+    else:
+        units = workbook_names
+        extract_unit = extract
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # executor.map yields in input order, so output is deterministic while
+        # later workbooks are still being fetched in the background
+        unit_results = (df for dfs in executor.map(extract_unit, units) for df in dfs)
+        yield from zip(workbook_names, unit_results)
 
 # =============================================================================
-# 5. MAIN
+# 6. OUTPUT WRITERS (ONE CHUNK PER WORKBOOK)
+# =============================================================================
+# Column order of every output format
+LINEAGE_COLUMNS = [
+    "workbook_name", "worksheet_name", "data_source_name", "dashboard_name",
+    "field_name", "field_type", "primary_field", "upstream_field_name",
+    "upstream_field_type", "formula", "upstream_column", "upstream_table",
+    "upstream_schema", "upstream_database", "is_primary"
+]
+
+# Columns that are booleans; every other column is text
+BOOLEAN_COLUMNS = {"primary_field", "is_primary"}
+
+# Define the CsvLineageWriter class: appends each workbook's rows to one CSV file
+class CsvLineageWriter:
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        # Start with just the header so an empty run still yields a valid file
+        pd.DataFrame(columns=LINEAGE_COLUMNS).to_csv(self.path, index=False)
+
+    def write(self, wb_name, df_lineage):
+        df_lineage.reindex(columns=LINEAGE_COLUMNS).to_csv(self.path, mode="a", header=False, index=False)
+        self.rows += len(df_lineage)
+
+    def close(self):
+        pass
+
+# Define the ParquetLineageWriter class: one row group per workbook in a single Parquet file
+class ParquetLineageWriter:
+    def __init__(self, path):
+        # pyarrow is only needed for this format
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.path = path
+        self.rows = 0
+        self.schema = pa.schema([
+            (column, pa.bool_() if column in BOOLEAN_COLUMNS else pa.string())
+            for column in LINEAGE_COLUMNS
+        ])
+        self.writer = pq.ParquetWriter(self.path, self.schema)
+
+    def write(self, wb_name, df_lineage):
+        df_chunk = df_lineage.reindex(columns=LINEAGE_COLUMNS)
+        table = self.pa.Table.from_pandas(df_chunk, schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)
+        self.rows += len(df_lineage)
+
+    def close(self):
+        self.writer.close()
+
+# Define the ExcelLineageWriter class: one sheet per workbook, for small outputs
+class ExcelLineageWriter:
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.writer = pd.ExcelWriter(self.path, engine="openpyxl")
+
+    def write(self, wb_name, df_lineage):
+        safe_sheet_name = wb_name[:31] or "Sheet"
+        df_lineage.to_excel(self.writer, sheet_name=safe_sheet_name, index=False)
+        self.rows += len(df_lineage)
+
+    def close(self):
+        if self.rows == 0:
+            pd.DataFrame({"No data found": []}).to_excel(self.writer, sheet_name="EmptyResults", index=False)
+            print(" - Created 'EmptyResults' sheet. No data for any workbook.")
+        self.writer.close()
+
+# Output formats: writer class and default file name
+WRITERS = {
+    "csv": (CsvLineageWriter, "lineage_output.csv"),
+    "parquet": (ParquetLineageWriter, "lineage_output.parquet"),
+    "excel": (ExcelLineageWriter, "lineage_output.xlsx"),
+}
+
+# =============================================================================
+# 7. MAIN
 # =============================================================================
 def main():
-    with open("workbooks.txt", "r") as f:
+    parser = argparse.ArgumentParser(description="Extract field-level lineage for the workbooks in a list.")
+    parser.add_argument("--workbooks-file", default="workbooks.txt", help="one workbook name per line")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="maximum number of workbooks extracted at once (1 = sequential)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help="sheets requested per Metadata API page")
+    parser.add_argument("--batch-size", type=int, default=WORKBOOK_BATCH_SIZE,
+                        help="workbooks fetched per nameWithin query (1 = one query per workbook)")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv",
+                        help="output format; parquet needs pyarrow, excel is only suited to small outputs")
+    parser.add_argument("--output", help="output file (default: lineage_output.<ext> for the format)")
+    args = parser.parse_args()
+
+    with open(args.workbooks_file, "r") as f:
         workbook_names = [line.strip() for line in f if line.strip()]
 
-    with pd.ExcelWriter("lineage_output.xlsx", engine="openpyxl") as writer:
-        wrote_any_data = False
-        for wb_name in workbook_names:
-            print(f"\nProcessing workbook: {wb_name}")
-            
-            # Step 1: Process workbook and generate lineage data
-            df_lineage = process_single_workbook(wb_name)
-            if df_lineage.empty:
-                print(f" - No data found or workbook not found: {wb_name}")
-                continue
-            
-            # Step 2: Fetch sheetFieldInstances for flagging primary fields
-            try:
-                primary_fields = get_sheet_field_instances(wb_name)
-                print(f" - Retrieved {len(primary_fields)} sheetFieldInstances for primary fields.")
-                
-                # Add a new 'is_primary' column in the lineage dataframe
-                df_lineage["is_primary"] = df_lineage.apply(
-                    lambda row: (row["worksheet_name"], row["field_name"]) in primary_fields,
-                    axis=1
-                )
-            except Exception as e:
-                print(f"Error fetching primary field instances for workbook '{wb_name}': {e}")
-                df_lineage["is_primary"] = False
-            
-            # Step 3: Write lineage data to Excel
-            wrote_any_data = True
-            safe_sheet_name = wb_name[:31] or "Sheet"
-            df_lineage.to_excel(writer, sheet_name=safe_sheet_name, index=False)
-            print(f" - Wrote {len(df_lineage)} rows to '{safe_sheet_name}'.")
-
-        if not wrote_any_data:
-            dummy_df = pd.DataFrame({"No data found": []})
-            dummy_df.to_excel(writer, "EmptyResults", index=False)
-            print(" - Created 'EmptyResults' sheet. No data for any workbook.")
+    writer_class, default_output = WRITERS[args.format]
+    output_path = args.output or default_output
+    writer = writer_class(output_path)
+    try:
+        with create_client(pool_size=args.concurrency) as client:
+            for wb_name, df_lineage in iter_workbook_lineage(client, workbook_names, args.batch_size,
+                                                             args.concurrency, args.page_size):
+                if df_lineage.empty:
+                    print(f" - No data found or workbook not found: {wb_name}")
+                    continue
 
-    print("\n--- Done. Check lineage_output.xlsx. ---")
+                # Step 3: Write this workbook's chunk, then let it go
+                writer.write(wb_name, df_lineage)
+                print(f" - Wrote {len(df_lineage)} rows for '{wb_name}'.")
+    finally:
+        writer.close()
+
+    print(f"\n--- Done. Wrote {writer.rows} rows to {output_path}. ---")
 
 
 if __name__ == "__main__":
     main()
-
-